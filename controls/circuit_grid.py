@@ -19,6 +19,7 @@ import numpy as np
 import pygame
 
 from model import circuit_node_types as node_types
+from model.batch_simulator import batch_probabilities
 from model.circuit_grid_model import CircuitGridNode
 from utils.colors import BLACK, WHITE, MAGENTA, GREEN
 from utils.navigation import MOVE_UP, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT
@@ -48,23 +49,26 @@ class CircuitGrid(pygame.sprite.RenderPlain):
         pygame.sprite.RenderPlain.__init__(self, self.circuit_grid_background,
                                            self.gate_tiles,
                                            self.circuit_grid_cursor)
+        # Only tiles in columns edited since the last update are rebuilt
+        self.dirty_columns = set(range(circuit_grid_model.max_columns))
+        circuit_grid_model.subscribe(self.on_node_changed)
         self.update()
 
-    def update(self, *args):
-
-        sprite_list = self.sprites()
-        for sprite in sprite_list:
-            sprite.update()
+    def on_node_changed(self, wire_num, column_num, old_node, new_node):
+        # Controls, traces and swaps are drawn on other wires of the same column
+        self.dirty_columns.add(column_num)
 
+    def update(self, *args):
         self.circuit_grid_background.rect.left = self.xpos
         self.circuit_grid_background.rect.top = self.ypos
 
-        for row_idx in range(self.circuit_grid_model.max_wires):
-            for col_idx in range(self.circuit_grid_model.max_columns):
-                self.gate_tiles[row_idx][col_idx].rect.centerx = \
-                    self.xpos + GRID_WIDTH * (col_idx + 1.5)
-                self.gate_tiles[row_idx][col_idx].rect.centery = \
-                    self.ypos + GRID_HEIGHT * (row_idx + 1.0)
+        for col_idx in sorted(self.dirty_columns):
+            for row_idx in range(self.circuit_grid_model.max_wires):
+                gate_tile = self.gate_tiles[row_idx][col_idx]
+                gate_tile.update()
+                gate_tile.rect.centerx = self.xpos + GRID_WIDTH * (col_idx + 1.5)
+                gate_tile.rect.centery = self.ypos + GRID_HEIGHT * (row_idx + 1.0)
+        self.dirty_columns.clear()
 
         self.highlight_selected_node(self.selected_wire, self.selected_column)
 
@@ -243,6 +247,58 @@ class CircuitGrid(pygame.sprite.RenderPlain):
 
         self.update()
 
+    def get_candidate_models(self):
+        """Copies of the model with each action available at the cursor applied"""
+        model = self.circuit_grid_model
+        wire_num, column_num = self.selected_wire, self.selected_column
+        selected_node_gate_part = self.get_selected_node_gate_part()
+        candidates = {}
+
+        if selected_node_gate_part == node_types.EMPTY:
+            for name, node_type in (('X', node_types.X), ('Y', node_types.Y),
+                                    ('Z', node_types.Z), ('H', node_types.H)):
+                variant = model.copy()
+                variant.set_node(wire_num, column_num, CircuitGridNode(node_type))
+                candidates[name] = variant
+        elif selected_node_gate_part == node_types.X or \
+                selected_node_gate_part == node_types.Y or \
+                selected_node_gate_part == node_types.Z or \
+                selected_node_gate_part == node_types.H:
+            node = model.get_node(wire_num, column_num)
+            if node.ctrl_a == -1:
+                # Same placement order as handle_input_ctrl: the wire above, then below
+                for ctrl_wire_num in (wire_num - 1, wire_num + 1):
+                    if 0 <= ctrl_wire_num < model.max_wires and \
+                            model.get_node_gate_part(ctrl_wire_num, column_num) in (node_types.EMPTY,
+                                                                                   node_types.TRACE):
+                        variant = model.copy()
+                        variant.set_node(wire_num, column_num,
+                                         CircuitGridNode(node.node_type, node.radians, ctrl_wire_num,
+                                                         node.ctrl_b, node.swap))
+                        variant.set_node(ctrl_wire_num, column_num, CircuitGridNode(node_types.EMPTY))
+                        candidates['CTRL'] = variant
+                        break
+            if selected_node_gate_part != node_types.H:
+                for name, radians in (('ROTATE+', np.pi / 8), ('ROTATE-', -np.pi / 8)):
+                    variant = model.copy()
+                    variant.set_node(wire_num, column_num,
+                                     CircuitGridNode(node.node_type, (node.radians + radians) % (2 * np.pi),
+                                                     node.ctrl_a, node.ctrl_b, node.swap))
+                    candidates[name] = variant
+        return candidates
+
+    def preview_candidates(self):
+        """Ship probabilities after each candidate action, in one batched pass.
+
+        Returns the action names and a (len(names), 2^n) probability array.
+        """
+        candidates = self.get_candidate_models()
+        if not candidates:
+            return [], np.empty((0, 2 ** self.circuit_grid_model.max_wires))
+        return list(candidates), batch_probabilities(self.circuit_grid_model,
+                                                     list(candidates.values()),
+                                                     self.selected_column)
+
     def place_ctrl_qubit(self, gate_wire_num, candidate_ctrl_wire_num):
         """Attempt to place a control qubit on a wire.
         If successful, return the wire number. If not, return -1
@@ -300,7 +356,7 @@ class CircuitGridBackground(pygame.sprite.Sprite):
         pygame.sprite.Sprite.__init__(self)
 
         self.image = pygame.Surface([GRID_WIDTH * (18 + 2),
-                                     GRID_HEIGHT * (3 + 1)])
+                                     GRID_HEIGHT * (circuit_grid_model.max_wires + 1)])
         self.image.convert()
         #self.image.fill(WHITE)
         self.rect = self.image.get_rect()
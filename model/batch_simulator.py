@@ -0,0 +1,48 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+
+from model.column_unitaries import COLUMN_UNITARIES
+
+
+def batch_probabilities(circuit_grid_model, variants, start_column=0):
+    """Ship probabilities for a batch of edited copies of a circuit grid.
+
+    Every variant must match circuit_grid_model in the columns before
+    start_column, so they all start from its cached state at that column.
+    The remaining columns are applied as column unitaries, one matrix
+    product per distinct column across the batch.
+
+    Returns an array of shape (len(variants), 2^n).
+    """
+    num_qubits = circuit_grid_model.max_wires
+    # The first preview fills the table with every single-gate column
+    COLUMN_UNITARIES.warm(num_qubits)
+    prefix_state = circuit_grid_model.get_column_state(start_column)
+    states = np.tile(prefix_state, (len(variants), 1))
+
+    for column_num in range(start_column, circuit_grid_model.max_columns):
+        groups = {}
+        for idx, variant in enumerate(variants):
+            groups.setdefault(variant.column_key(column_num), []).append(idx)
+        for column_key, indices in groups.items():
+            unitary = COLUMN_UNITARIES.get(num_qubits, column_key)
+            if len(indices) == len(variants):
+                states = states @ unitary.T
+            else:
+                states[indices] = states[indices] @ unitary.T
+
+    return states.real ** 2 + states.imag ** 2
@@ -13,20 +13,66 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-import numpy as np
+import itertools
 
-from qiskit import QuantumCircuit, QuantumRegister
+import numpy as np
 
 from model import circuit_node_types as node_types
+from model import statevector_simulator
+from model import stabilizer_simulator
+from model import circuit_ir
+from model.circuit_ir import CircuitIR
+from model.circuit_optimizer import optimize
+from model.column_unitaries import COLUMN_UNITARIES
+from model.node_key import NodeKey, EMPTY_NODE_KEY
 from utils.parameters import CIRCUIT_DEPTH
 
+# node_type of a cell that was never set; get_node() returns None for it
+NO_NODE = -2
+# Per-node fields, each stored as a (max_wires, max_columns) array
+NODE_FIELDS = ('node_type', 'radians', 'ctrl_a', 'ctrl_b', 'swap')
+
+# Versions come from one shared counter, so a version number also
+# identifies which grid it belongs to
+_versions = itertools.count(1)
+
 
 class CircuitGridModel:
-    """Grid-based model that is built when user interacts with circuit"""
+    """Grid-based model that is built when user interacts with circuit.
+
+    Nodes are stored as parallel typed arrays, one per CircuitGridNode field.
+    gate_parts and control_gate_wires are derived per column on the first
+    query after the column is edited, so set_node stays a few array writes.
+    """
     def __init__(self, max_wires, max_columns):
         self.max_wires = max_wires
         self.max_columns = max_columns
-        self.nodes = np.empty((max_wires, max_columns), dtype=CircuitGridNode)
+        shape = (max_wires, max_columns)
+        self.node_type = np.full(shape, NO_NODE, dtype=np.int8)
+        self.radians = np.zeros(shape)
+        self.ctrl_a = np.full(shape, -1, dtype=np.int8)
+        self.ctrl_b = np.full(shape, -1, dtype=np.int8)
+        self.swap = np.full(shape, -1, dtype=np.int8)
+        # What each cell displays (CTRL and SWAP parts included), and for
+        # CTRL parts the wire of the gate they control
+        self.gate_parts = np.full(shape, node_types.EMPTY, dtype=np.int8)
+        self.control_gate_wires = np.full(shape, -1, dtype=np.int8)
+        self.indexed_columns = [True] * max_columns
+        # Immutable column keys, shared with copies and the undo history until edited
+        self.column_key_cache = [None] * max_columns
+        # Packed IR ops of each column, rebuilt only for edited columns
+        self.column_ops = [None] * max_columns
+        # column_states[k] holds the statevector before column k is applied.
+        # Allocated on first use, so wide Clifford grids never pay for 2^n.
+        self.column_states = None
+        self.first_dirty_column = 0
+        # prefix_unitaries[k] is the product of the column unitaries before column k
+        self.prefix_unitaries = None
+        self.first_stale_unitary = 0
+        self.ir = None
+        # Bumped on every edit; listeners are told which node changed
+        self.version = next(_versions)
+        self.listeners = []
 
     def __str__(self):
         retval = ''
@@ -37,12 +83,15 @@ class CircuitGridModel:
         return 'CircuitGridModel: ' + retval
 
     def set_node(self, wire_num, column_num, circuit_grid_node):
-        self.nodes[wire_num][column_num] = \
-            CircuitGridNode(circuit_grid_node.node_type,
-                            circuit_grid_node.radians,
-                            circuit_grid_node.ctrl_a,
-                            circuit_grid_node.ctrl_b,
-                            circuit_grid_node.swap)
+        old_node = self.get_node(wire_num, column_num) if self.listeners else None
+        self.node_type[wire_num, column_num] = circuit_grid_node.node_type
+        self.radians[wire_num, column_num] = circuit_grid_node.radians
+        self.ctrl_a[wire_num, column_num] = circuit_grid_node.ctrl_a
+        self.ctrl_b[wire_num, column_num] = circuit_grid_node.ctrl_b
+        self.swap[wire_num, column_num] = circuit_grid_node.swap
+        self.invalidate_column(column_num)
+        if self.listeners:
+            self.notify(wire_num, column_num, old_node, self.get_node(wire_num, column_num))
 
         # TODO: Decide whether to protect as shown below
         # if not self.nodes[wire_num][column_num]:
@@ -50,128 +99,214 @@ class CircuitGridModel:
         # else:
         #     print('Node ', wire_num, column_num, ' not empty')
 
-    def get_node(self, wire_num, column_num):
-        return self.nodes[wire_num][column_num]
+    def invalidate_column(self, column_num):
+        """Drop everything cached from the given column onwards and bump the version"""
+        self.first_dirty_column = min(self.first_dirty_column, column_num)
+        self.first_stale_unitary = min(self.first_stale_unitary, column_num)
+        self.column_key_cache[column_num] = None
+        self.column_ops[column_num] = None
+        self.indexed_columns[column_num] = False
+        self.ir = None
+        self.version = next(_versions)
 
-    def get_node_gate_part(self, wire_num, column_num):
-        requested_node = self.nodes[wire_num][column_num]
-        if requested_node and requested_node.node_type != node_types.EMPTY:
-            # Node is occupied so return its gate
-            return requested_node.node_type
-        else:
-            # Check for control nodes from gates in other nodes in this column
-            nodes_in_column = self.nodes[:, column_num]
+    def index_column(self, column_num):
+        """Recompute the gate parts and control links of one column"""
+        node_type = self.node_type[:, column_num].tolist()
+        ctrl_a = self.ctrl_a[:, column_num].tolist()
+        ctrl_b = self.ctrl_b[:, column_num].tolist()
+        swap = self.swap[:, column_num].tolist()
+        gate_parts = []
+        control_gate_wires = []
+        for wire_num in range(self.max_wires):
+            gate_part = node_type[wire_num] if node_type[wire_num] > node_types.EMPTY else None
+            control_gate_wire = -1
             for idx in range(self.max_wires):
                 if idx != wire_num:
-                    other_node = nodes_in_column[idx]
-                    if other_node:
-                        if other_node.ctrl_a == wire_num or other_node.ctrl_b == wire_num:
-                            return node_types.CTRL
-                        elif other_node.swap == wire_num:
-                            return node_types.SWAP
+                    # The first linked gate in wire order decides between CTRL and SWAP
+                    if ctrl_a[idx] == wire_num or ctrl_b[idx] == wire_num:
+                        gate_part = node_types.CTRL if gate_part is None else gate_part
+                        control_gate_wire = idx
+                    elif swap[idx] == wire_num:
+                        gate_part = node_types.SWAP if gate_part is None else gate_part
+            gate_parts.append(node_types.EMPTY if gate_part is None else gate_part)
+            control_gate_wires.append(control_gate_wire)
+        self.gate_parts[:, column_num] = gate_parts
+        self.control_gate_wires[:, column_num] = control_gate_wires
+        self.indexed_columns[column_num] = True
 
-        return node_types.EMPTY
+    def subscribe(self, listener):
+        """Call listener(wire_num, column_num, old_node, new_node) after every change"""
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, wire_num, column_num, old_node, new_node):
+        for listener in self.listeners:
+            listener(wire_num, column_num, old_node, new_node)
+
+    def get_node(self, wire_num, column_num):
+        """The node at a cell, as a new CircuitGridNode; edits need set_node()"""
+        node_type = int(self.node_type[wire_num, column_num])
+        if node_type == NO_NODE:
+            return None
+        return CircuitGridNode(node_type,
+                               float(self.radians[wire_num, column_num]),
+                               int(self.ctrl_a[wire_num, column_num]),
+                               int(self.ctrl_b[wire_num, column_num]),
+                               int(self.swap[wire_num, column_num]))
+
+    def get_node_gate_part(self, wire_num, column_num):
+        if not self.indexed_columns[column_num]:
+            self.index_column(column_num)
+        return int(self.gate_parts[wire_num, column_num])
 
     def get_gate_wire_for_control_node(self, control_wire_num, column_num):
         """Get wire for gate that belongs to a control node on the given wire"""
-        gate_wire_num = -1
-        nodes_in_column = self.nodes[:, column_num]
-        for wire_idx in range(self.max_wires):
-            if wire_idx != control_wire_num:
-                other_node = nodes_in_column[wire_idx]
-                if other_node:
-                    if other_node.ctrl_a == control_wire_num or \
-                            other_node.ctrl_b == control_wire_num:
-                        gate_wire_num =  wire_idx
-                        print("Found gate: ",
-                              self.get_node_gate_part(gate_wire_num, column_num),
-                              " on wire: " , gate_wire_num)
+        if not self.indexed_columns[column_num]:
+            self.index_column(column_num)
+        gate_wire_num = int(self.control_gate_wires[control_wire_num, column_num])
+        if gate_wire_num >= 0:
+            print("Found gate: ",
+                  self.get_node_gate_part(gate_wire_num, column_num),
+                  " on wire: " , gate_wire_num)
         return gate_wire_num
 
+    def build_column_keys(self, columns):
+        """Column keys computed from the node arrays for a list of columns"""
+        fields = (np.maximum(self.node_type[:, columns], node_types.EMPTY),
+                  np.round(self.radians[:, columns], 9),
+                  self.ctrl_a[:, columns], self.ctrl_b[:, columns], self.swap[:, columns])
+        node_type, radians, ctrl_a, ctrl_b, swap = (field.T.tolist() for field in fields)
+        # Empty cells share one key object, which keeps history entries small
+        return [tuple(EMPTY_NODE_KEY if key == EMPTY_NODE_KEY else key for key in map(NodeKey, *column))
+                for column in zip(node_type, radians, ctrl_a, ctrl_b, swap)]
+
+    def column_keys(self):
+        """Canonical, hashable description of the nodes in each column"""
+        missing = [column_num for column_num, key in enumerate(self.column_key_cache) if key is None]
+        if missing:
+            for column_num, key in zip(missing, self.build_column_keys(missing)):
+                self.column_key_cache[column_num] = key
+        return tuple(self.column_key_cache)
+
+    def column_key(self, column_num):
+        """Canonical, hashable description of the nodes in one column"""
+        if self.column_key_cache[column_num] is None:
+            self.column_key_cache[column_num] = self.build_column_keys([column_num])[0]
+        return self.column_key_cache[column_num]
+
+    def fingerprint(self):
+        """Canonical, hashable description of every node in the grid"""
+        return self.max_wires, self.max_columns, self.column_keys()
+
+    def build_column_ops(self):
+        """IR ops of every column, building only those edited since the last call"""
+        missing = [column_num for column_num, ops in enumerate(self.column_ops) if ops is None]
+        if missing:
+            for column_num, ops in zip(missing, circuit_ir.column_ops(self, missing)):
+                self.column_ops[column_num] = ops
+        return self.column_ops
+
+    def to_ir(self):
+        """CircuitIR of the grid, rebuilt only after an edit"""
+        if self.ir is None:
+            self.ir = CircuitIR.from_column_ops(self.max_wires, self.build_column_ops())
+        return self.ir
+
+    def optimized_gate_count(self):
+        """Number of gates left after the peephole optimizer"""
+        return len(optimize(self.to_ir()))
+
+    def load_fingerprint(self, fingerprint):
+        """Make the grid match a fingerprint, setting only the nodes that differ"""
+        _, _, column_keys = fingerprint
+        # Builds every missing key of the current grid in one pass
+        self.column_keys()
+        self.load_column_keys(enumerate(column_keys))
+
+    def load_column_keys(self, column_keys):
+        """Set columns from (column_num, key) pairs, setting only the nodes that differ"""
+        for column_num, column_key in column_keys:
+            current_key = self.column_key(column_num)
+            if current_key != column_key:
+                for wire_num in range(self.max_wires):
+                    if current_key[wire_num] != column_key[wire_num]:
+                        self.set_node(wire_num, column_num, column_key[wire_num])
+                self.column_key_cache[column_num] = column_key
+
     def compute_circuit(self):
-        qr = QuantumRegister(self.max_wires, 'q')
-        qc = QuantumCircuit(qr)
-
-        for column_num in range(self.max_columns):
-            for wire_num in range(self.max_wires):
-                node = self.nodes[wire_num][column_num]
-                if node:
-                    if node.node_type == node_types.IDEN:
-                        # Identity gate
-                        qc.iden(qr[wire_num])
-                    elif node.node_type == node_types.X:
-                        if node.radians == 0:
-                            if node.ctrl_a != -1:
-                                if node.ctrl_b != -1:
-                                    # Toffoli gate
-                                    qc.ccx(qr[node.ctrl_a], qr[node.ctrl_b], qr[wire_num])
-                                else:
-                                    # Controlled X gate
-                                    qc.cx(qr[node.ctrl_a], qr[wire_num])
-                            else:
-                                # Pauli-X gate
-                                qc.x(qr[wire_num])
-                        else:
-                            # Rotation around X axis
-                            qc.rx(node.radians, qr[wire_num])
-                    elif node.node_type == node_types.Y:
-                        if node.radians == 0:
-                            if node.ctrl_a != -1:
-                                # Controlled Y gate
-                                qc.cy(qr[node.ctrl_a], qr[wire_num])
-                            else:
-                                # Pauli-Y gate
-                                qc.y(qr[wire_num])
-                        else:
-                            # Rotation around Y axis
-                            qc.ry(node.radians, qr[wire_num])
-                    elif node.node_type == node_types.Z:
-                        if node.radians == 0:
-                            if node.ctrl_a != -1:
-                                # Controlled Z gate
-                                qc.cz(qr[node.ctrl_a], qr[wire_num])
-                            else:
-                                # Pauli-Z gate
-                                qc.z(qr[wire_num])
-                        else:
-                            if node.ctrl_a != -1:
-                                # Controlled rotation around the Z axis
-                                qc.crz(node.radians, qr[node.ctrl_a], qr[wire_num])
-                            else:
-                                # Rotation around Z axis
-                                qc.rz(node.radians, qr[wire_num])
-                    elif node.node_type == node_types.S:
-                        # S gate
-                        qc.s(qr[wire_num])
-                    elif node.node_type == node_types.SDG:
-                        # S dagger gate
-                        qc.sdg(qr[wire_num])
-                    elif node.node_type == node_types.T:
-                        # T gate
-                        qc.t(qr[wire_num])
-                    elif node.node_type == node_types.TDG:
-                        # T dagger gate
-                        qc.tdg(qr[wire_num])
-                    elif node.node_type == node_types.H:
-                        if node.ctrl_a != -1:
-                            # Controlled Hadamard
-                            qc.ch(qr[node.ctrl_a], qr[wire_num])
-                        else:
-                            # Hadamard gate
-                            qc.h(qr[wire_num])
-                    elif node.node_type == node_types.SWAP:
-                        if node.ctrl_a != -1:
-                            # Controlled Swap
-                            qc.cswap(qr[node.ctrl_a], qr[wire_num], qr[node.swap])
-                        else:
-                            # Swap gate
-                            qc.swap(qr[wire_num], qr[node.swap])
-
-        return qc
+        return self.to_ir().to_quantum_circuit()
+
+    def compute_statevector(self):
+        """Simulate the grid, replaying only the columns edited since the last call"""
+        if self.column_states is None:
+            self.column_states = np.zeros((self.max_columns + 1, 2 ** self.max_wires), dtype=complex)
+            self.column_states[0] = statevector_simulator.initial_state(self.max_wires)
+            self.first_dirty_column = 0
+        column_ops = self.build_column_ops()
+        for column_num in range(self.first_dirty_column, self.max_columns):
+            state = self.column_states[column_num + 1]
+            state[:] = self.column_states[column_num]
+            statevector_simulator.apply_column(state, self.max_wires, column_ops[column_num])
+        self.first_dirty_column = self.max_columns
+        return self.column_states[-1].copy()
+
+    def get_column_state(self, column_num):
+        """Statevector before the given column is applied"""
+        self.compute_statevector()
+        return self.column_states[column_num].copy()
+
+    def copy(self):
+        """Independent model with the same nodes"""
+        other = CircuitGridModel(self.max_wires, self.max_columns)
+        for name in NODE_FIELDS + ('gate_parts', 'control_gate_wires'):
+            np.copyto(getattr(other, name), getattr(self, name))
+        other.indexed_columns = list(self.indexed_columns)
+        other.column_key_cache = list(self.column_key_cache)
+        other.column_ops = list(self.column_ops)
+        return other
+
+    def to_stabilizer(self):
+        """Tableau of the grid's state, for Clifford-only grids"""
+        return stabilizer_simulator.run_ir(optimize(self.to_ir()))
+
+    def compute_unitary(self):
+        """Unitary of the whole grid, multiplying back in only the edited columns"""
+        if self.prefix_unitaries is None:
+            dim = 2 ** self.max_wires
+            self.prefix_unitaries = np.zeros((self.max_columns + 1, dim, dim), dtype=complex)
+            self.prefix_unitaries[0] = np.eye(dim)
+            self.first_stale_unitary = 0
+        for column_num in range(self.first_stale_unitary, self.max_columns):
+            column_unitary = COLUMN_UNITARIES.get(self.max_wires, self.column_key(column_num))
+            np.matmul(column_unitary, self.prefix_unitaries[column_num],
+                      out=self.prefix_unitaries[column_num + 1])
+        self.first_stale_unitary = self.max_columns
+        return self.prefix_unitaries[-1].copy()
+
+    def compute_output_state(self, basis_index):
+        """Statevector the grid produces from the given computational basis state"""
+        self.compute_unitary()
+        return self.prefix_unitaries[-1][:, basis_index].copy()
 
     def reset_circuit(self):
-        self.nodes = np.empty((self.max_wires, self.max_columns),
-                              dtype=CircuitGridNode)
+        old_nodes = [(wire_num, column_num, self.get_node(wire_num, column_num))
+                     for wire_num, column_num in zip(*np.nonzero(self.node_type != NO_NODE))]
+        self.node_type.fill(NO_NODE)
+        self.radians.fill(0.0)
+        for name in ('ctrl_a', 'ctrl_b', 'swap', 'control_gate_wires'):
+            getattr(self, name).fill(-1)
+        self.gate_parts.fill(node_types.EMPTY)
+        self.indexed_columns = [True] * self.max_columns
+        self.column_key_cache = [None] * self.max_columns
+        self.column_ops = [None] * self.max_columns
+        self.first_dirty_column = 0
+        self.first_stale_unitary = 0
+        self.ir = None
+        self.version = next(_versions)
+        for wire_num, column_num, old_node in old_nodes:
+            self.notify(int(wire_num), int(column_num), old_node, None)
         # the game crashes if the circuit is empty
         # initialize circuit with 3 identity gate at the end to prevent crash
         # identity gate are displayed by completely transparent PNG
@@ -0,0 +1,159 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from model.column_unitaries import ROTATION_STEPS
+from model.node_key import NodeKey, EMPTY_NODE_KEY
+
+# What to load for an undo or redo: (wire_num, column_num, node) triples and
+# the probabilities for the resulting grid, or None
+GridChange = namedtuple('GridChange', ['nodes', 'probabilities'])
+
+# An entry is the header, then for each cell the edit changed its column,
+# wire and node before and after the edit, then optionally the probabilities
+# as float16, and last the entry's size so that it can be popped off the end
+HEADER = struct.Struct('<BH')
+# NodeKey fields, with radians as a count of rotation steps
+NODE_FORMAT = 'bbbbb'
+CELL = struct.Struct('<BB' + NODE_FORMAT * 2)
+FOOTER = struct.Struct('<H')
+# Rotations placed with handle_input_rotate are multiples of this
+ROTATION_STEP = 2 * np.pi / ROTATION_STEPS
+
+
+class CircuitHistory:
+    """Undo and redo stacks of grid edits, kept within a memory budget.
+
+    Entries hold only the cells an edit changed, as their nodes before and
+    after it, and are applied against the live grid. Each stack packs its
+    entries back to back in one bytearray, and the oldest undo entries are
+    dropped past max_bytes.
+    """
+    def __init__(self, max_bytes=65536):
+        self.max_bytes = max_bytes
+        self.undo_entries = bytearray()
+        self.redo_entries = bytearray()
+
+    def record(self, before, after, probabilities=None):
+        """Remember an edit between two grid fingerprints.
+
+        probabilities, when given, are the simulation result for the grid
+        before the edit, so that undoing it needs no simulation.
+        """
+        cells = [(column_num, wire_num, node_before, node_after)
+                 for column_num, (key_before, key_after) in enumerate(zip(before[2], after[2]))
+                 if key_before is not key_after
+                 for wire_num, (node_before, node_after) in enumerate(zip(key_before, key_after))
+                 if node_before != node_after]
+        if not cells:
+            return
+        self.redo_entries.clear()
+        self.undo_entries += pack_entry(cells, probabilities)
+        while self.memory_usage() > self.max_bytes:
+            oldest = entry_size(self.undo_entries)
+            if oldest == len(self.undo_entries):
+                break
+            del self.undo_entries[:oldest]
+
+    def undo(self, probabilities=None):
+        """GridChange to apply for an undo, or None.
+
+        probabilities belong to the grid as it is now, which becomes redoable.
+        """
+        if not self.undo_entries:
+            return None
+        return self.move(self.undo_entries, self.redo_entries, 2, probabilities)
+
+    def redo(self, probabilities=None):
+        """GridChange to apply for a redo, or None.
+
+        probabilities belong to the grid as it is now, which becomes undoable.
+        """
+        if not self.redo_entries:
+            return None
+        return self.move(self.redo_entries, self.undo_entries, 3, probabilities)
+
+    def move(self, source, target, side, probabilities):
+        """Pop the newest entry from source and push it on target with new probabilities"""
+        size, = FOOTER.unpack_from(source, len(source) - FOOTER.size)
+        cells, stored_probabilities = unpack_entry(source, len(source) - size)
+        del source[-size:]
+        target += pack_entry(cells, probabilities)
+        return GridChange([(cell[1], cell[0], cell[side]) for cell in cells], stored_probabilities)
+
+    def can_undo(self):
+        return bool(self.undo_entries)
+
+    def can_redo(self):
+        return bool(self.redo_entries)
+
+    def memory_usage(self):
+        """Bytes held by both stacks"""
+        return len(self.undo_entries) + len(self.redo_entries)
+
+    def clear(self):
+        self.undo_entries.clear()
+        self.redo_entries.clear()
+
+
+def pack_node(node):
+    return (node.node_type, round(node.radians / ROTATION_STEP),
+            node.ctrl_a, node.ctrl_b, node.swap)
+
+
+def unpack_node(fields):
+    node_type, steps, ctrl_a, ctrl_b, swap = fields
+    node = NodeKey(node_type, round(steps * ROTATION_STEP, 9), ctrl_a, ctrl_b, swap)
+    # Empty cells go back to sharing one key object
+    return EMPTY_NODE_KEY if node == EMPTY_NODE_KEY else node
+
+
+def pack_entry(cells, probabilities):
+    """Pack (column_num, wire_num, node_before, node_after) cells and the probabilities"""
+    data = [HEADER.pack(len(cells), 0 if probabilities is None else len(probabilities))]
+    for column_num, wire_num, node_before, node_after in cells:
+        data.append(CELL.pack(column_num, wire_num, *pack_node(node_before), *pack_node(node_after)))
+    if probabilities is not None:
+        data.append(np.asarray(probabilities, dtype=np.float16).tobytes())
+    size = sum(map(len, data)) + FOOTER.size
+    data.append(FOOTER.pack(size))
+    return b''.join(data)
+
+
+def entry_size(entries, offset=0):
+    num_cells, num_probabilities = HEADER.unpack_from(entries, offset)
+    return HEADER.size + num_cells * CELL.size + 2 * num_probabilities + FOOTER.size
+
+
+def unpack_entry(entries, offset=0):
+    """The cells and probabilities of the entry starting at offset"""
+    num_cells, num_probabilities = HEADER.unpack_from(entries, offset)
+    offset += HEADER.size
+    cells = []
+    for _ in range(num_cells):
+        fields = CELL.unpack_from(entries, offset)
+        cells.append((fields[0], fields[1], unpack_node(fields[2:7]), unpack_node(fields[7:])))
+        offset += CELL.size
+    probabilities = None
+    if num_probabilities:
+        probabilities = np.frombuffer(entries, dtype=np.float16, count=num_probabilities,
+                                      offset=offset).astype(float)
+        probabilities /= probabilities.sum()
+        probabilities.setflags(write=False)
+    return cells, probabilities
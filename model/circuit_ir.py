@@ -0,0 +1,194 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import struct
+from functools import lru_cache
+
+import numpy as np
+
+from model import circuit_node_types as node_types
+from model.node_key import NodeKey
+
+# Opcodes, one per distinct gate the circuit grid can produce
+IDEN = 0
+X = 1
+Y = 2
+Z = 3
+H = 4
+S = 5
+SDG = 6
+T = 7
+TDG = 8
+RX = 9
+RY = 10
+RZ = 11
+CX = 12
+CCX = 13
+CY = 14
+CZ = 15
+CRZ = 16
+CH = 17
+SWAP = 18
+CSWAP = 19
+
+# Name of the QuantumCircuit method that appends each opcode
+OPCODE_NAMES = ['iden', 'x', 'y', 'z', 'h', 's', 'sdg', 't', 'tdg', 'rx', 'ry', 'rz',
+                'cx', 'ccx', 'cy', 'cz', 'crz', 'ch', 'swap', 'cswap']
+PARAMETRIC_OPCODES = frozenset([RX, RY, RZ, CRZ])
+SWAP_OPCODES = frozenset([SWAP, CSWAP])
+
+OP_DTYPE = np.dtype([('opcode', np.uint8),
+                     ('column', np.int16),
+                     ('target', np.int8),
+                     ('ctrl_a', np.int8),
+                     ('ctrl_b', np.int8),
+                     ('swap', np.int8),
+                     ('theta', np.float64)])
+# Packs an op tuple into the bytes of one OP_DTYPE record
+OP_STRUCT = struct.Struct('=Bhbbbbd')
+
+
+def node_op(column_num, wire_num, node):
+    """Translate a grid node into an op tuple, or None if it applies no gate"""
+    node_type = node.node_type
+    if node_type == node_types.IDEN:
+        opcode = IDEN
+    elif node_type == node_types.X:
+        if node.radians != 0:
+            return RX, column_num, wire_num, -1, -1, -1, node.radians
+        elif node.ctrl_a != -1:
+            if node.ctrl_b != -1:
+                return CCX, column_num, wire_num, node.ctrl_a, node.ctrl_b, -1, 0.0
+            return CX, column_num, wire_num, node.ctrl_a, -1, -1, 0.0
+        opcode = X
+    elif node_type == node_types.Y:
+        if node.radians != 0:
+            return RY, column_num, wire_num, -1, -1, -1, node.radians
+        elif node.ctrl_a != -1:
+            return CY, column_num, wire_num, node.ctrl_a, -1, -1, 0.0
+        opcode = Y
+    elif node_type == node_types.Z:
+        if node.radians != 0:
+            if node.ctrl_a != -1:
+                return CRZ, column_num, wire_num, node.ctrl_a, -1, -1, node.radians
+            return RZ, column_num, wire_num, -1, -1, -1, node.radians
+        elif node.ctrl_a != -1:
+            return CZ, column_num, wire_num, node.ctrl_a, -1, -1, 0.0
+        opcode = Z
+    elif node_type == node_types.S:
+        opcode = S
+    elif node_type == node_types.SDG:
+        opcode = SDG
+    elif node_type == node_types.T:
+        opcode = T
+    elif node_type == node_types.TDG:
+        opcode = TDG
+    elif node_type == node_types.H:
+        if node.ctrl_a != -1:
+            return CH, column_num, wire_num, node.ctrl_a, -1, -1, 0.0
+        opcode = H
+    elif node_type == node_types.SWAP:
+        if node.ctrl_a != -1:
+            return CSWAP, column_num, wire_num, node.ctrl_a, -1, node.swap, 0.0
+        return SWAP, column_num, wire_num, -1, -1, node.swap, 0.0
+    else:
+        return None
+    return opcode, column_num, wire_num, -1, -1, -1, 0.0
+
+
+@lru_cache(maxsize=4096)
+def node_record(column_num, wire_num, node_type, radians, ctrl_a, ctrl_b, swap):
+    """Packed OP_DTYPE record of a grid node, empty if it applies no gate"""
+    op = node_op(column_num, wire_num, NodeKey(node_type, radians, ctrl_a, ctrl_b, swap))
+    return OP_STRUCT.pack(*op) if op else b''
+
+
+def column_ops(circuit_grid_model, column_nums):
+    """Packed OP_DTYPE records of the gates in each of the given columns, in wire order"""
+    node_type = circuit_grid_model.node_type.tolist()
+    radians, ctrl_a, ctrl_b, swap = (circuit_grid_model.radians, circuit_grid_model.ctrl_a,
+                                     circuit_grid_model.ctrl_b, circuit_grid_model.swap)
+    columns = []
+    for column_num in column_nums:
+        packed = b''
+        for wire_num, wire_types in enumerate(node_type):
+            if wire_types[column_num] > node_types.EMPTY:
+                cell = wire_num, column_num
+                packed += node_record(column_num, wire_num, wire_types[column_num], float(radians[cell]),
+                                      int(ctrl_a[cell]), int(ctrl_b[cell]), int(swap[cell]))
+        columns.append(packed)
+    return columns
+
+
+def unpack_ops(packed):
+    """Op tuples of packed OP_DTYPE records"""
+    return OP_STRUCT.iter_unpack(packed)
+
+
+class CircuitIR:
+    """Compact, hashable gate list built straight from the circuit grid.
+
+    ops is a structured array of OP_DTYPE records in application order
+    (column by column, then wire by wire).
+    """
+    __slots__ = ['num_qubits', 'ops', '_hash']
+
+    def __init__(self, num_qubits, ops):
+        self.num_qubits = num_qubits
+        self.ops = ops
+        self._hash = None
+
+    @classmethod
+    def from_column_ops(cls, num_qubits, column_ops):
+        """Join the packed records of each column, see column_ops()"""
+        # Joining bytes avoids numpy's slow concatenation of structured arrays
+        return cls(num_qubits, np.frombuffer(b''.join(column_ops), dtype=OP_DTYPE))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops.tolist())
+
+    def __eq__(self, other):
+        return isinstance(other, CircuitIR) and self.num_qubits == other.num_qubits and \
+            self.ops.tobytes() == other.ops.tobytes()
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.num_qubits, self.ops.tobytes()))
+        return self._hash
+
+    def opcodes(self):
+        return frozenset(self.ops['opcode'].tolist())
+
+    def to_bytes(self):
+        return bytes([self.num_qubits]) + self.ops.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], np.frombuffer(data, dtype=OP_DTYPE, offset=1).copy())
+
+    def to_quantum_circuit(self):
+        """Convert to a Qiskit QuantumCircuit, only needed by the Qiskit backend"""
+        from qiskit import QuantumCircuit, QuantumRegister
+
+        quantum_register = QuantumRegister(self.num_qubits, 'q')
+        quantum_circuit = QuantumCircuit(quantum_register)
+        for opcode, _, target, ctrl_a, ctrl_b, swap, theta in self:
+            params = [theta] if opcode in PARAMETRIC_OPCODES else []
+            qubits = [quantum_register[wire] for wire in (ctrl_a, ctrl_b, target, swap) if wire != -1]
+            getattr(quantum_circuit, OPCODE_NAMES[opcode])(*params, *qubits)
+        return quantum_circuit
@@ -0,0 +1,169 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from functools import lru_cache
+
+import numpy as np
+
+from model import circuit_ir
+from model.circuit_ir import CircuitIR, OP_DTYPE
+
+ATOL = 1e-9
+
+# Gates that are their own inverse, cancelled when applied twice in a row
+SELF_INVERSE_OPCODES = frozenset([circuit_ir.X, circuit_ir.Y, circuit_ir.Z, circuit_ir.H,
+                                  circuit_ir.CX, circuit_ir.CCX, circuit_ir.CY,
+                                  circuit_ir.CZ, circuit_ir.CH,
+                                  circuit_ir.SWAP, circuit_ir.CSWAP])
+
+# Single qubit gates of the form diag(1, e^(i phase)), which merge into one gate
+PHASES = {
+    circuit_ir.Z: np.pi,
+    circuit_ir.S: np.pi / 2,
+    circuit_ir.SDG: -np.pi / 2,
+    circuit_ir.T: np.pi / 4,
+    circuit_ir.TDG: -np.pi / 4,
+}
+
+# Gates diagonal on their target, and gates in span{I, X} on their target
+DIAGONAL_OPCODES = frozenset([circuit_ir.IDEN, circuit_ir.Z, circuit_ir.S, circuit_ir.SDG,
+                              circuit_ir.T, circuit_ir.TDG, circuit_ir.RZ,
+                              circuit_ir.CZ, circuit_ir.CRZ])
+X_AXIS_OPCODES = frozenset([circuit_ir.X, circuit_ir.RX, circuit_ir.CX, circuit_ir.CCX])
+
+# Rotations are the identity when theta is a multiple of their period
+ROTATION_PERIODS = {
+    circuit_ir.RX: 4 * np.pi,
+    circuit_ir.RY: 4 * np.pi,
+    circuit_ir.RZ: 2 * np.pi,
+    circuit_ir.CRZ: 4 * np.pi,
+}
+
+DIAGONAL, X_AXIS, GENERAL = 0, 1, 2
+
+
+def _is_multiple(theta, period):
+    remainder = theta % period
+    return remainder < ATOL or period - remainder < ATOL
+
+
+def _wire_actions(op):
+    """Map each wire an op touches to how it acts there"""
+    opcode, _, target, ctrl_a, ctrl_b, swap, _ = op
+    actions = {ctrl: DIAGONAL for ctrl in (ctrl_a, ctrl_b) if ctrl != -1}
+    if opcode in DIAGONAL_OPCODES:
+        actions[target] = DIAGONAL
+    elif opcode in X_AXIS_OPCODES:
+        actions[target] = X_AXIS
+    else:
+        actions[target] = GENERAL
+    if swap != -1:
+        actions[swap] = GENERAL
+    return actions
+
+
+def _commute(first, second):
+    """Ops commute if on every shared wire both act diagonally, or both along X"""
+    first_actions = _wire_actions(first)
+    second_actions = _wire_actions(second)
+    for wire, action in first_actions.items():
+        if wire in second_actions:
+            if action == GENERAL or action != second_actions[wire]:
+                return False
+    return True
+
+
+def _operands(op):
+    """Operands of an op, ignoring the order of interchangeable wires"""
+    opcode, _, target, ctrl_a, ctrl_b, swap, _ = op
+    return frozenset((ctrl_a, ctrl_b)), frozenset((target, swap))
+
+
+def _phase_op(column, target, phase):
+    phase = phase % (2 * np.pi)
+    if _is_multiple(phase, 2 * np.pi):
+        return None
+    for opcode, gate_phase in PHASES.items():
+        if abs(phase - gate_phase % (2 * np.pi)) < ATOL:
+            return opcode, column, target, -1, -1, -1, 0.0
+    return circuit_ir.RZ, column, target, -1, -1, -1, phase
+
+
+def _merge(first, second):
+    """Combine two ops into a single op.
+
+    Returns (True, op) when they merge, op being None if they cancel out,
+    and (False, None) when they cannot be combined.
+    """
+    first_opcode, column, target = first[:3]
+    second_opcode = second[0]
+
+    first_phase = first[6] if first_opcode == circuit_ir.RZ else PHASES.get(first_opcode)
+    second_phase = second[6] if second_opcode == circuit_ir.RZ else PHASES.get(second_opcode)
+    if first_phase is not None and second_phase is not None:
+        if target != second[2]:
+            return False, None
+        return True, _phase_op(column, target, first_phase + second_phase)
+
+    if first_opcode != second_opcode or _operands(first) != _operands(second):
+        return False, None
+    if first_opcode in SELF_INVERSE_OPCODES:
+        return True, None
+    if first_opcode in ROTATION_PERIODS:
+        period = ROTATION_PERIODS[first_opcode]
+        theta = (first[6] + second[6]) % period
+        if _is_multiple(theta, period):
+            return True, None
+        return True, first[:6] + (theta,)
+    return False, None
+
+
+def _is_identity(op):
+    opcode, theta = op[0], op[6]
+    if opcode == circuit_ir.IDEN:
+        return True
+    return opcode in ROTATION_PERIODS and _is_multiple(theta, ROTATION_PERIODS[opcode])
+
+
+@lru_cache(maxsize=1024)
+def optimize(ir):
+    """Peephole pass over a CircuitIR.
+
+    Drops identities, cancels self-inverse pairs, merges rotations about the
+    same axis and phase gates on the same wire, looking past gates that
+    commute with the one being placed.
+    """
+    result = []
+    for op in ir:
+        if _is_identity(op):
+            continue
+        placed = False
+        for idx in range(len(result) - 1, -1, -1):
+            previous = result[idx]
+            if previous is None:
+                continue
+            merged, merged_op = _merge(previous, op)
+            if merged:
+                result[idx] = merged_op
+                placed = True
+                break
+            if not _commute(previous, op):
+                break
+        if not placed:
+            result.append(op)
+
+    ops = np.array([op for op in result if op is not None], dtype=OP_DTYPE)
+    ops.setflags(write=False)
+    return CircuitIR(ir.num_qubits, ops)
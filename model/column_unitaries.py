@@ -0,0 +1,80 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import OrderedDict
+
+import numpy as np
+
+from model import circuit_node_types as node_types
+from model import statevector_simulator
+from model.node_key import NodeKey, EMPTY_NODE_KEY
+
+# Rotations placed with handle_input_rotate are multiples of pi/8
+ROTATION_STEPS = 16
+
+SINGLE_QUBIT_TYPES = [node_types.IDEN, node_types.X, node_types.Y, node_types.Z,
+                      node_types.S, node_types.SDG, node_types.T, node_types.TDG,
+                      node_types.H]
+ROTATION_TYPES = [node_types.X, node_types.Y, node_types.Z]
+
+
+class ColumnUnitaryTable:
+    """Bounded table of 2^n x 2^n column unitaries keyed by column contents"""
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.warmed = set()
+
+    def get(self, num_qubits, column_key):
+        key = (num_qubits, column_key)
+        unitary = self.entries.get(key)
+        if unitary is None:
+            unitary = self.build(num_qubits, column_key)
+            self.entries[key] = unitary
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return unitary
+
+    @staticmethod
+    def build(num_qubits, column_key):
+        """Apply the column to every basis state at once"""
+        unitary = np.eye(2 ** num_qubits, dtype=complex)
+        for wire_num, node in enumerate(column_key):
+            statevector_simulator.apply_node(unitary, num_qubits, wire_num, node)
+        unitary.setflags(write=False)
+        return unitary
+
+    def warm(self, num_qubits):
+        """Precompute every column holding a single uncontrolled gate, once per register size"""
+        if num_qubits in self.warmed:
+            return
+        self.warmed.add(num_qubits)
+        nodes = [NodeKey(node_type, 0.0, -1, -1, -1) for node_type in SINGLE_QUBIT_TYPES]
+        for node_type in ROTATION_TYPES:
+            for step in range(1, ROTATION_STEPS):
+                nodes.append(NodeKey(node_type, round(step * 2 * np.pi / ROTATION_STEPS, 9), -1, -1, -1))
+
+        empty_column = [EMPTY_NODE_KEY] * num_qubits
+        self.get(num_qubits, tuple(empty_column))
+        for wire_num in range(num_qubits):
+            for node in nodes:
+                column_key = list(empty_column)
+                column_key[wire_num] = node
+                self.get(num_qubits, tuple(column_key))
+
+
+COLUMN_UNITARIES = ColumnUnitaryTable()
@@ -0,0 +1,26 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import namedtuple
+
+from model import circuit_node_types as node_types
+
+
+class NodeKey(namedtuple('NodeKey', ['node_type', 'radians', 'ctrl_a', 'ctrl_b', 'swap'])):
+    """Immutable snapshot of a node, usable as a dictionary key"""
+    __slots__ = ()
+
+
+EMPTY_NODE_KEY = NodeKey(node_types.EMPTY, 0.0, -1, -1, -1)
@@ -0,0 +1,85 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+
+
+class OutcomeSampler:
+    """Draws measurement outcomes in O(1) with Vose's alias method.
+
+    Outcomes are pre-drawn in batches into a ring buffer so that sampling
+    during a burst of hits does not allocate. The tables are only rebuilt
+    when set_probabilities receives a different distribution.
+    """
+    def __init__(self, num_outcomes, seed=None, batch_size=64):
+        self.num_outcomes = num_outcomes
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.probabilities = None
+
+        self.threshold = np.ones(num_outcomes)
+        self.alias = np.arange(num_outcomes)
+
+        self.buffer = np.empty(batch_size, dtype=np.int64)
+        self.position = batch_size
+        self._uniform = np.empty(batch_size)
+        self._index = np.empty(batch_size, dtype=np.int64)
+        self._cutoff = np.empty(batch_size)
+        self._accept = np.empty(batch_size, dtype=bool)
+
+    def set_probabilities(self, probabilities):
+        """Rebuild the alias table, unless the distribution is unchanged"""
+        probabilities = np.asarray(probabilities, dtype=float)
+        if self.probabilities is not None and np.array_equal(probabilities, self.probabilities):
+            return
+        self.probabilities = probabilities.copy()
+
+        scaled = probabilities * self.num_outcomes / probabilities.sum()
+        small = [idx for idx in range(self.num_outcomes) if scaled[idx] < 1.0]
+        large = [idx for idx in range(self.num_outcomes) if scaled[idx] >= 1.0]
+        self.threshold[:] = 1.0
+        self.alias[:] = np.arange(self.num_outcomes)
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.threshold[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Outcomes drawn from the previous distribution are stale
+        self.position = self.batch_size
+
+    def refill(self):
+        """Pre-draw a full batch of outcomes into the ring buffer"""
+        np.multiply(self.rng.random(out=self._uniform), self.num_outcomes, out=self._uniform)
+        self._index[:] = self._uniform
+        np.subtract(self._uniform, self._index, out=self._uniform)
+        np.take(self.threshold, self._index, out=self._cutoff)
+        np.less(self._uniform, self._cutoff, out=self._accept)
+        np.take(self.alias, self._index, out=self.buffer)
+        np.copyto(self.buffer, self._index, where=self._accept)
+        self.position = 0
+
+    def sample(self):
+        """Return the next measurement outcome"""
+        if self.position >= self.batch_size:
+            self.refill()
+        outcome = self.buffer[self.position]
+        self.position += 1
+        return int(outcome)
@@ -0,0 +1,91 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+
+from model.circuit_grid_model import CircuitGridModel
+
+
+class SimulationWorker(threading.Thread):
+    """Simulates circuit grid edits on a background thread.
+
+    Requests are versioned and only the newest one is kept: a request that
+    has not started, or whose result arrives after a newer edit, is dropped.
+    The worker keeps its own copy of the grid and applies each request as a
+    diff, so the backend still only resimulates the edited columns.
+    A backend error is handed back with the result, so one bad grid does
+    not stop the thread.
+    """
+    def __init__(self, backend, max_wires, max_columns):
+        threading.Thread.__init__(self, daemon=True)
+        self.backend = backend
+        self.circuit_grid_model = CircuitGridModel(max_wires, max_columns)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.result = None
+        self.version = 0
+        self.dropped = 0
+
+    def submit(self, circuit_grid_model):
+        """Queue the current state of the grid, returning the request version"""
+        fingerprint = circuit_grid_model.fingerprint()
+        with self.condition:
+            self.version += 1
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (self.version, fingerprint)
+            # A finished older request no longer describes the grid
+            self.result = None
+            self.condition.notify()
+            return self.version
+
+    def cancel(self):
+        """Drop queued and in-flight requests, e.g. when the result is already known"""
+        with self.condition:
+            self.version += 1
+            if self.pending is not None:
+                self.dropped += 1
+                self.pending = None
+            self.result = None
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                version, fingerprint = self.pending
+                self.pending = None
+
+            try:
+                self.circuit_grid_model.load_fingerprint(fingerprint)
+                probabilities = self.backend.get_probabilities(self.circuit_grid_model)
+                error = None
+            except Exception as exception:
+                probabilities, error = None, exception
+
+            with self.condition:
+                if version == self.version:
+                    self.result = (version, probabilities, error)
+                else:
+                    self.dropped += 1
+
+    def poll(self):
+        """Return (version, probabilities, error) for the newest finished request, once.
+
+        probabilities is None when the backend raised error instead.
+        """
+        with self.condition:
+            result, self.result = self.result, None
+            return result
@@ -0,0 +1,235 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import time
+
+import numpy as np
+
+from model import circuit_node_types as node_types
+from model import stabilizer_simulator
+from model.circuit_grid_model import CircuitGridModel, CircuitGridNode
+from model.circuit_optimizer import optimize
+from model.statevector_cache import StatevectorCache
+from utils.parameters import SIMULATOR_BACKEND, STATEVECTOR_CACHE_SIZE, MEASUREMENT_SHOTS
+
+# Environment variable overriding SIMULATOR_BACKEND, e.g. "numpy" or "auto"
+BACKEND_ENV_VAR = 'SPACE_INVADERS_BACKEND'
+# Backends "auto" chooses between. Qiskit is left out, so that the game
+# never has to import it unless it is asked for by name. So is the stabilizer:
+# the ships need a dense probability per basis state, so its tableau saves no
+# memory here, and it calibrates slower than numpy at every register size.
+AUTO_CANDIDATES = ('numpy',)
+
+
+class SimulatorBackend:
+    """Computes ship probabilities and measurements for a circuit grid"""
+    name = None
+    # Whether supports() accepts every grid the composer can build
+    universal = True
+
+    def supports(self, ir):
+        """Whether the backend can simulate every gate in the circuit IR"""
+        return True
+
+    def get_probabilities(self, circuit_grid_model):
+        raise NotImplementedError
+
+    def get_measurement(self, circuit_grid_model):
+        return int(self.get_measurements(circuit_grid_model, 1)[0])
+
+    def get_measurements(self, circuit_grid_model, shots):
+        """Outcomes of measuring the grid's state shots times.
+
+        The game samples hits from get_probabilities() instead, see
+        ShipGroup.sample_outcome().
+        """
+        probabilities = self.get_probabilities(circuit_grid_model)
+        return np.random.choice(len(probabilities), size=shots, p=probabilities / probabilities.sum())
+
+
+class QiskitBackend(SimulatorBackend):
+    """Runs the circuit through Qiskit's BasicAer simulators.
+
+    The measured circuit is built once per grid version, and measurements
+    are run as one multi-shot job whose outcomes are handed out one by one
+    until they run out or the grid changes. The game itself samples hits
+    from the probabilities, so this is for callers outside the game loop.
+    Qiskit is only imported once the backend is used.
+    """
+    name = 'qiskit'
+
+    def __init__(self, shots=MEASUREMENT_SHOTS):
+        self.shots = shots
+        self.measured_version = None
+        self.measured_circuit = None
+        self.outcomes = []
+
+    def get_probabilities(self, circuit_grid_model):
+        from qiskit import BasicAer, execute
+
+        circuit = circuit_grid_model.compute_circuit()
+        backend_sv_sim = BasicAer.get_backend('statevector_simulator')
+        job_sim = execute(circuit, backend_sv_sim, shots=1)
+        quantum_state = job_sim.result().get_statevector(circuit, decimals=3)
+        return np.abs(quantum_state) ** 2
+
+    def get_measured_circuit(self, circuit_grid_model):
+        """The grid's circuit with every qubit measured, rebuilt only after an edit"""
+        if circuit_grid_model.version != self.measured_version:
+            from qiskit import ClassicalRegister
+
+            # compute_circuit builds a fresh circuit, so it can be extended in place
+            measure_circuit = circuit_grid_model.compute_circuit()
+            cr = ClassicalRegister(circuit_grid_model.max_wires)
+            measure_circuit.add_register(cr)
+            measure_circuit.measure(measure_circuit.qregs[0], cr)
+            self.measured_circuit = measure_circuit
+            self.measured_version = circuit_grid_model.version
+            # Outcomes from the previous circuit no longer apply
+            self.outcomes = []
+        return self.measured_circuit
+
+    def get_measurements(self, circuit_grid_model, shots):
+        from qiskit import BasicAer, execute
+
+        measure_circuit = self.get_measured_circuit(circuit_grid_model)
+        backend_sv_sim = BasicAer.get_backend('qasm_simulator')
+        job_sim = execute(measure_circuit, backend_sv_sim, shots=shots)
+        counts = job_sim.result().get_counts(measure_circuit)
+        outcomes = np.repeat([int(bits, 2) for bits in counts], list(counts.values()))
+        np.random.shuffle(outcomes)
+        return outcomes
+
+    def get_measurement(self, circuit_grid_model):
+        self.get_measured_circuit(circuit_grid_model)
+        if not self.outcomes:
+            self.outcomes = self.get_measurements(circuit_grid_model, self.shots).tolist()
+        return self.outcomes.pop()
+
+
+class NumpyBackend(SimulatorBackend):
+    """Native incremental statevector engine behind an LRU cache"""
+    name = 'numpy'
+
+    def __init__(self, cache_size=STATEVECTOR_CACHE_SIZE):
+        self.statevector_cache = StatevectorCache(cache_size)
+
+    def get_statevector(self, circuit_grid_model):
+        return self.statevector_cache.get(circuit_grid_model)
+
+    def get_probabilities(self, circuit_grid_model):
+        state = self.get_statevector(circuit_grid_model)
+        return state.real ** 2 + state.imag ** 2
+
+
+class StabilizerBackend(SimulatorBackend):
+    """Tableau simulator, limited to Clifford circuits.
+
+    Only used when asked for by name, see AUTO_CANDIDATES. Wide Clifford
+    circuits can be sampled and queried per basis state through
+    stabilizer_simulator directly.
+    """
+    name = 'stabilizer'
+    universal = False
+
+    def supports(self, ir):
+        return stabilizer_simulator.is_clifford(optimize(ir))
+
+    def get_probabilities(self, circuit_grid_model):
+        return circuit_grid_model.to_stabilizer().probabilities()
+
+    def get_measurement(self, circuit_grid_model):
+        return circuit_grid_model.to_stabilizer().sample()
+
+
+BACKENDS = {
+    QiskitBackend.name: QiskitBackend,
+    NumpyBackend.name: NumpyBackend,
+    StabilizerBackend.name: StabilizerBackend,
+}
+
+
+def calibration_model(num_qubits, num_columns):
+    """Clifford grid every backend can run: a GHZ preparation"""
+    circuit_grid_model = CircuitGridModel(num_qubits, num_columns)
+    circuit_grid_model.set_node(0, 0, CircuitGridNode(node_types.H))
+    for wire_num in range(1, num_qubits):
+        circuit_grid_model.set_node(wire_num, min(wire_num, num_columns - 1),
+                                    CircuitGridNode(node_types.X, ctrl_a=wire_num - 1))
+    return circuit_grid_model
+
+
+class FallbackBackend(SimulatorBackend):
+    """Runs each circuit on the first of its backends that supports it"""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def select(self, circuit_grid_model):
+        ir = circuit_grid_model.to_ir()
+        for backend in self.backends:
+            if backend.supports(ir):
+                return backend
+
+    def get_probabilities(self, circuit_grid_model):
+        return self.select(circuit_grid_model).get_probabilities(circuit_grid_model)
+
+    def get_measurement(self, circuit_grid_model):
+        return self.select(circuit_grid_model).get_measurement(circuit_grid_model)
+
+
+class AutoBackend(FallbackBackend):
+    """Delegates to the fastest calibrated backend that supports the circuit.
+
+    The backends are ordered by a short benchmark at startup.
+    """
+    name = 'auto'
+
+    def __init__(self, num_qubits, num_columns, candidates=None, repeats=3):
+        self.backends = [BACKENDS[name]() for name in (candidates or AUTO_CANDIDATES)]
+        self.timings = self.calibrate(num_qubits, num_columns, repeats)
+        self.backends.sort(key=lambda backend: self.timings[backend.name])
+
+    def calibrate(self, num_qubits, num_columns, repeats):
+        """Time each backend over a series of distinct single-column edits"""
+        edits = [node_types.X, node_types.Y, node_types.Z, node_types.H, node_types.S]
+        column_num = num_columns // 2
+        timings = {}
+        for backend in self.backends:
+            circuit_grid_model = calibration_model(num_qubits, num_columns)
+            elapsed = []
+            for edit in edits[:repeats + 1]:
+                circuit_grid_model.set_node(num_qubits - 1, column_num, CircuitGridNode(edit))
+                start = time.perf_counter()
+                backend.get_probabilities(circuit_grid_model)
+                elapsed.append(time.perf_counter() - start)
+            # The first run pays one-off warm up costs
+            timings[backend.name] = min(elapsed[1:])
+        return timings
+
+
+def get_backend(num_qubits, num_columns, name=None):
+    """Backend named by the argument, the environment or SIMULATOR_BACKEND"""
+    name = name or os.environ.get(BACKEND_ENV_VAR, SIMULATOR_BACKEND)
+    if name == AutoBackend.name:
+        return AutoBackend(num_qubits, num_columns)
+    if name not in BACKENDS:
+        raise ValueError('Unknown simulator backend: ' + name)
+    backend = BACKENDS[name]()
+    if not backend.universal:
+        # Grids the backend cannot run go to the statevector engine instead
+        return FallbackBackend([backend, NumpyBackend()])
+    return backend
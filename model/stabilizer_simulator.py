@@ -0,0 +1,228 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+
+from model import circuit_ir
+
+CLIFFORD_OPCODES = frozenset([circuit_ir.IDEN, circuit_ir.X, circuit_ir.Y, circuit_ir.Z,
+                              circuit_ir.H, circuit_ir.S, circuit_ir.SDG,
+                              circuit_ir.CX, circuit_ir.CY, circuit_ir.CZ,
+                              circuit_ir.SWAP])
+
+
+def is_clifford(ir):
+    """True if the circuit only uses gates the stabilizer simulator supports"""
+    return ir.opcodes() <= CLIFFORD_OPCODES
+
+
+class StabilizerSimulator:
+    """Aaronson-Gottesman tableau simulator for Clifford circuits.
+
+    Rows 0..n-1 hold the destabilizers, rows n..2n-1 the stabilizers and
+    row 2n is scratch space. Memory and gate cost are polynomial in the
+    number of qubits, so wide circuits avoid the 2^n statevector.
+    """
+    def __init__(self, num_qubits, seed=None):
+        self.num_qubits = num_qubits
+        self.x = np.zeros((2 * num_qubits + 1, num_qubits), dtype=bool)
+        self.z = np.zeros((2 * num_qubits + 1, num_qubits), dtype=bool)
+        self.r = np.zeros(2 * num_qubits + 1, dtype=bool)
+        idx = np.arange(num_qubits)
+        self.x[idx, idx] = True
+        self.z[idx + num_qubits, idx] = True
+        self.rng = np.random.default_rng(seed)
+
+    def copy(self):
+        other = StabilizerSimulator.__new__(StabilizerSimulator)
+        other.num_qubits = self.num_qubits
+        other.x = self.x.copy()
+        other.z = self.z.copy()
+        other.r = self.r.copy()
+        other.rng = self.rng
+        return other
+
+    def h(self, wire):
+        self.r ^= self.x[:, wire] & self.z[:, wire]
+        self.x[:, wire], self.z[:, wire] = self.z[:, wire].copy(), self.x[:, wire].copy()
+
+    def s(self, wire):
+        self.r ^= self.x[:, wire] & self.z[:, wire]
+        self.z[:, wire] ^= self.x[:, wire]
+
+    def sdg(self, wire):
+        self.s(wire)
+        self.pauli_z(wire)
+
+    def pauli_x(self, wire):
+        self.r ^= self.z[:, wire]
+
+    def pauli_y(self, wire):
+        self.r ^= self.x[:, wire] ^ self.z[:, wire]
+
+    def pauli_z(self, wire):
+        self.r ^= self.x[:, wire]
+
+    def cx(self, control, target):
+        self.r ^= self.x[:, control] & self.z[:, target] & ~(self.x[:, target] ^ self.z[:, control])
+        self.x[:, target] ^= self.x[:, control]
+        self.z[:, control] ^= self.z[:, target]
+
+    def cy(self, control, target):
+        self.sdg(target)
+        self.cx(control, target)
+        self.s(target)
+
+    def cz(self, control, target):
+        self.h(target)
+        self.cx(control, target)
+        self.h(target)
+
+    def swap(self, wire_a, wire_b):
+        self.cx(wire_a, wire_b)
+        self.cx(wire_b, wire_a)
+        self.cx(wire_a, wire_b)
+
+    def apply_op(self, opcode, target, ctrl_a, swap):
+        if opcode == circuit_ir.H:
+            self.h(target)
+        elif opcode == circuit_ir.S:
+            self.s(target)
+        elif opcode == circuit_ir.SDG:
+            self.sdg(target)
+        elif opcode == circuit_ir.X:
+            self.pauli_x(target)
+        elif opcode == circuit_ir.Y:
+            self.pauli_y(target)
+        elif opcode == circuit_ir.Z:
+            self.pauli_z(target)
+        elif opcode == circuit_ir.CX:
+            self.cx(ctrl_a, target)
+        elif opcode == circuit_ir.CY:
+            self.cy(ctrl_a, target)
+        elif opcode == circuit_ir.CZ:
+            self.cz(ctrl_a, target)
+        elif opcode == circuit_ir.SWAP:
+            self.swap(target, swap)
+        elif opcode != circuit_ir.IDEN:
+            raise ValueError('Gate is not a Clifford gate: ' + circuit_ir.OPCODE_NAMES[opcode])
+
+    def _rowsum(self, target_row, source_row):
+        """Multiply the Pauli in target_row by the one in source_row"""
+        x1, z1 = self.x[source_row], self.z[source_row]
+        x2, z2 = self.x[target_row], self.z[target_row]
+        # Power of i picked up by each single qubit product
+        phase = np.where(x1 & z1, z2.astype(int) - x2,
+                         np.where(x1, z2 * (2 * x2.astype(int) - 1),
+                                  np.where(z1, x2 * (1 - 2 * z2.astype(int)), 0)))
+        total = 2 * int(self.r[target_row]) + 2 * int(self.r[source_row]) + int(phase.sum())
+        self.r[target_row] = total % 4 == 2
+        self.x[target_row] ^= x1
+        self.z[target_row] ^= z1
+
+    def _random_row(self, wire):
+        """Stabilizer row anticommuting with Z on the wire, or None if Z is determined"""
+        rows = np.flatnonzero(self.x[self.num_qubits:2 * self.num_qubits, wire])
+        return rows[0] + self.num_qubits if len(rows) else None
+
+    def _collapse(self, wire, pivot, outcome):
+        num_qubits = self.num_qubits
+        for row in np.flatnonzero(self.x[:2 * num_qubits, wire]):
+            if row != pivot:
+                self._rowsum(row, pivot)
+        self.x[pivot - num_qubits] = self.x[pivot]
+        self.z[pivot - num_qubits] = self.z[pivot]
+        self.r[pivot - num_qubits] = self.r[pivot]
+        self.x[pivot] = False
+        self.z[pivot] = False
+        self.z[pivot, wire] = True
+        self.r[pivot] = outcome
+
+    def _determined_outcome(self, wire):
+        num_qubits = self.num_qubits
+        scratch = 2 * num_qubits
+        self.x[scratch] = False
+        self.z[scratch] = False
+        self.r[scratch] = False
+        for row in np.flatnonzero(self.x[:num_qubits, wire]):
+            self._rowsum(scratch, row + num_qubits)
+        return int(self.r[scratch])
+
+    def measure(self, wire, outcome=None):
+        """Measure a qubit, forcing the outcome if it is random and one is given.
+
+        Returns (outcome, probability of that outcome).
+        """
+        pivot = self._random_row(wire)
+        if pivot is None:
+            return self._determined_outcome(wire), 1.0
+        if outcome is None:
+            outcome = int(self.rng.integers(2))
+        self._collapse(wire, pivot, outcome)
+        return outcome, 0.5
+
+    def sample(self):
+        """Measure every qubit of a copy, returning the basis state index"""
+        tableau = self.copy()
+        index = 0
+        for wire in range(self.num_qubits):
+            outcome, _ = tableau.measure(wire)
+            index |= outcome << wire
+        return index
+
+    def probability(self, basis_index):
+        """Probability of measuring the given computational basis state"""
+        tableau = self.copy()
+        probability = 1.0
+        for wire in range(self.num_qubits):
+            bit = (basis_index >> wire) & 1
+            outcome, outcome_probability = tableau.measure(wire, bit)
+            if outcome != bit:
+                return 0.0
+            probability *= outcome_probability
+        return probability
+
+    def support(self):
+        """Map each basis state with nonzero probability to its probability"""
+        branches = [(self.copy(), 0, 1.0)]
+        for wire in range(self.num_qubits):
+            next_branches = []
+            for tableau, index, probability in branches:
+                if tableau._random_row(wire) is None:
+                    outcome, _ = tableau.measure(wire)
+                    next_branches.append((tableau, index | outcome << wire, probability))
+                else:
+                    other = tableau.copy()
+                    tableau.measure(wire, 0)
+                    other.measure(wire, 1)
+                    next_branches.append((tableau, index, probability / 2))
+                    next_branches.append((other, index | 1 << wire, probability / 2))
+            branches = next_branches
+        return {index: probability for _, index, probability in branches}
+
+    def probabilities(self):
+        """Dense probability vector, only practical for a few qubits"""
+        probabilities = np.zeros(2 ** self.num_qubits)
+        for index, probability in self.support().items():
+            probabilities[index] = probability
+        return probabilities
+
+
+def run_ir(ir, seed=None):
+    """Simulate a Clifford CircuitIR, returning the tableau"""
+    simulator = StabilizerSimulator(ir.num_qubits, seed)
+    for opcode, _, target, ctrl_a, _, swap, _ in ir:
+        simulator.apply_op(opcode, target, ctrl_a, swap)
+    return simulator
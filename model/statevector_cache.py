@@ -0,0 +1,68 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import OrderedDict, namedtuple
+
+from model.circuit_optimizer import optimize
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'size', 'maxsize'])
+
+
+class StatevectorCache:
+    """Bounded LRU cache of statevectors.
+
+    Keys are the optimized circuit IR, so grids that reduce to the same
+    gates (e.g. a gate toggled on and off, or a cancelling pair) share
+    an entry. The key of recently seen grid versions is remembered, so an
+    unchanged grid skips building and optimizing its IR.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version_keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, circuit_grid_model):
+        """Return the (read-only) statevector, simulating only on a miss"""
+        key = self.version_keys.get(circuit_grid_model.version)
+        if key is None:
+            key = optimize(circuit_grid_model.to_ir())
+            self.version_keys[circuit_grid_model.version] = key
+            if len(self.version_keys) > self.maxsize:
+                self.version_keys.popitem(last=False)
+        state = self.entries.get(key)
+        if state is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return state
+
+        self.misses += 1
+        state = circuit_grid_model.compute_statevector()
+        state.setflags(write=False)
+        self.entries[key] = state
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return state
+
+    def clear(self):
+        self.entries.clear()
+        self.version_keys.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         len(self.entries), self.maxsize)
@@ -0,0 +1,147 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from functools import lru_cache
+
+import numpy as np
+
+from model import circuit_ir
+
+# Single qubit gate matrices. Qubit 0 is the least significant bit of a
+# basis state index, the same ordering used by Qiskit's statevector.
+IDEN_GATE = np.eye(2, dtype=complex)
+X_GATE = np.array([[0, 1], [1, 0]], dtype=complex)
+Y_GATE = np.array([[0, -1j], [1j, 0]], dtype=complex)
+Z_GATE = np.array([[1, 0], [0, -1]], dtype=complex)
+H_GATE = np.array([[1, 1], [1, -1]], dtype=complex) / np.sqrt(2)
+S_GATE = np.array([[1, 0], [0, 1j]], dtype=complex)
+SDG_GATE = np.array([[1, 0], [0, -1j]], dtype=complex)
+T_GATE = np.array([[1, 0], [0, np.exp(1j * np.pi / 4)]], dtype=complex)
+TDG_GATE = np.array([[1, 0], [0, np.exp(-1j * np.pi / 4)]], dtype=complex)
+
+
+def rx_gate(theta):
+    cos, sin = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[cos, -1j * sin], [-1j * sin, cos]], dtype=complex)
+
+
+def ry_gate(theta):
+    cos, sin = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[cos, -sin], [sin, cos]], dtype=complex)
+
+
+def rz_gate(theta):
+    # Qiskit's rz is defined as u1, i.e. a phase on |1> only
+    return np.array([[1, 0], [0, np.exp(1j * theta)]], dtype=complex)
+
+
+def crz_gate(theta):
+    # Qiskit's crz applies diag(e^(-i theta/2), e^(i theta/2)) to the target
+    return np.array([[np.exp(-0.5j * theta), 0], [0, np.exp(0.5j * theta)]], dtype=complex)
+
+
+FIXED_GATES = {
+    circuit_ir.IDEN: IDEN_GATE,
+    circuit_ir.X: X_GATE,
+    circuit_ir.CX: X_GATE,
+    circuit_ir.CCX: X_GATE,
+    circuit_ir.Y: Y_GATE,
+    circuit_ir.CY: Y_GATE,
+    circuit_ir.Z: Z_GATE,
+    circuit_ir.CZ: Z_GATE,
+    circuit_ir.H: H_GATE,
+    circuit_ir.CH: H_GATE,
+    circuit_ir.S: S_GATE,
+    circuit_ir.SDG: SDG_GATE,
+    circuit_ir.T: T_GATE,
+    circuit_ir.TDG: TDG_GATE,
+}
+PARAMETRIC_GATES = {
+    circuit_ir.RX: rx_gate,
+    circuit_ir.RY: ry_gate,
+    circuit_ir.RZ: rz_gate,
+    circuit_ir.CRZ: crz_gate,
+}
+
+
+def initial_state(num_qubits):
+    """Return the |0...0> statevector"""
+    state = np.zeros(2 ** num_qubits, dtype=complex)
+    state[0] = 1.0
+    return state
+
+
+@lru_cache(maxsize=None)
+def _pair_indices(num_qubits, wire_a, wire_b, bits_a, bits_b, controls):
+    """Flat indices of the amplitude pairs a kernel mixes.
+
+    Selects basis states where every control is |1>, with the two returned
+    arrays differing only in the values (bits_a, bits_b) taken by the wires.
+    """
+    basis = np.arange(2 ** num_qubits)
+    mask = (basis >> wire_a) & 1 == 0
+    mask &= (basis >> wire_b) & 1 == 0
+    for control in controls:
+        mask &= (basis >> control) & 1 == 1
+    base = basis[mask]
+    first = base | (bits_a[0] << wire_a) | (bits_b[0] << wire_b)
+    second = base | (bits_a[1] << wire_a) | (bits_b[1] << wire_b)
+    return first, second
+
+
+def apply_gate(state, num_qubits, gate, target, controls=()):
+    """Apply a 2x2 gate in place to the target qubit, conditioned on controls"""
+    idx0, idx1 = _pair_indices(num_qubits, target, target, (0, 1), (0, 1), tuple(controls))
+    amp0 = state[idx0]
+    amp1 = state[idx1]
+    state[idx0] = gate[0, 0] * amp0 + gate[0, 1] * amp1
+    state[idx1] = gate[1, 0] * amp0 + gate[1, 1] * amp1
+    return state
+
+
+def apply_swap(state, num_qubits, wire_a, wire_b, controls=()):
+    """Exchange two qubits in place, conditioned on controls"""
+    idx01, idx10 = _pair_indices(num_qubits, wire_a, wire_b, (0, 1), (1, 0), tuple(controls))
+    amp01 = state[idx01]
+    state[idx01] = state[idx10]
+    state[idx10] = amp01
+    return state
+
+
+def apply_op(state, num_qubits, opcode, target, ctrl_a, ctrl_b, swap, theta):
+    """Apply one circuit IR op in place"""
+    controls = tuple(ctrl for ctrl in (ctrl_a, ctrl_b) if ctrl != -1)
+    if opcode in circuit_ir.SWAP_OPCODES:
+        apply_swap(state, num_qubits, target, swap, controls)
+    elif opcode in PARAMETRIC_GATES:
+        apply_gate(state, num_qubits, PARAMETRIC_GATES[opcode](theta), target, controls)
+    else:
+        apply_gate(state, num_qubits, FIXED_GATES[opcode], target, controls)
+    return state
+
+
+def apply_node(state, num_qubits, wire_num, node):
+    """Apply the gate a grid node represents"""
+    op = circuit_ir.node_op(0, wire_num, node)
+    if op:
+        apply_op(state, num_qubits, op[0], *op[2:])
+    return state
+
+
+def apply_column(state, num_qubits, ops):
+    """Apply the packed IR ops of one circuit grid column in place"""
+    for opcode, _, target, ctrl_a, ctrl_b, swap, theta in circuit_ir.unpack_ops(ops):
+        apply_op(state, num_qubits, opcode, target, ctrl_a, ctrl_b, swap, theta)
+    return state
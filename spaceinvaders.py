@@ -3,7 +3,11 @@
 # Space Invaders
 # Created by Lee Robinson
 
+from time import perf_counter
+STARTUP_TIME = perf_counter()
+
 from pygame import *
+import atexit
 import sys
 from os.path import abspath, dirname
 from random import choice
@@ -11,13 +15,43 @@ import numpy as np
 from enum import Enum
 
 from model.circuit_grid_model import CircuitGridModel
+from model.circuit_history import CircuitHistory
+from model.simulator_backends import get_backend
+from model.simulation_worker import SimulationWorker
+from model.outcome_sampler import OutcomeSampler
 from controls.circuit_grid import CircuitGrid, CircuitGridNode
-from copy import deepcopy
 
+from utils.image_cache import ImageRegistry, TintCache
+from utils.dirty_screen import DirtyScreen
+from utils.glyph_atlas import GlyphAtlas, DIGITS
+from utils.layers import StaticLayer, LayerGroup
+from utils.text_cache import FontRegistry, TextCache
 from utils.navigation import MOVE_UP, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT
 from utils.parameters import WIDTH_UNIT, WINDOW_HEIGHT, WINDOW_WIDTH, \
-    LEFT, RIGHT, NOTHING, NO, YES, MEASURE_LEFT, MEASURE_RIGHT, WINDOW_SIZE
-from qiskit import BasicAer, execute, ClassicalRegister
+    LEFT, RIGHT, NOTHING, NO, YES, MEASURE_LEFT, MEASURE_RIGHT, WINDOW_SIZE, \
+    GRID_HEIGHT, SHIP_QUBITS, UNDO_HISTORY_BYTES, DIRTY_RECT_RENDERING
+
+
+class StartupTimer(object):
+    """Splits the time from launch to the first frame into named phases"""
+    def __init__(self, start):
+        self.last = start
+        self.phases = []
+
+    def mark(self, phase):
+        now = perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        total = sum(elapsed for _, elapsed in self.phases)
+        print('Startup ' + ', '.join('{} {:.0f} ms'.format(phase, elapsed * 1000)
+                                     for phase, elapsed in self.phases) +
+              ' (total {:.0f} ms)'.format(total * 1000))
+
+
+startup_timer = StartupTimer(STARTUP_TIME)
+startup_timer.mark('imports')
 
 BASE_PATH = abspath(dirname(__file__))
 FONT_PATH = BASE_PATH + '/fonts/'
@@ -37,6 +71,8 @@ SCREEN_HEIGHT = 300
 SCREEN = display.set_mode((800, 640))
 #screen = display.set_mode(WINDOW_SIZE)
 FONT = FONT_PATH + 'space_invaders.ttf'
+FONTS = FontRegistry()
+TEXTS = TextCache(FONTS)
 IMG_NAMES = ['ship', 'mystery',
              'enemy1_1', 'enemy1_2',
              'enemy2_1', 'enemy2_2',
@@ -45,13 +81,41 @@ IMG_NAMES = ['ship', 'mystery',
              'laser', 'enemylaser']
 IMAGES = {name: image.load(IMAGE_PATH + '{}.png'.format(name)).convert_alpha()
           for name in IMG_NAMES}
-POSITIONS = [20, 120, 220, 320, 420, 520, 620, 720]
-# OFFSETS = [-100, 0, -200, 100, -300, 200, -400, 300]
-OFFSETS = [-400, -300, -200, -100, 0, 100, 200, 300]
-DISTRIBUTIONS = [25.0, 25.0, 15.0, 15.0, 7.0, 7.0, 3.0, 3.0]
-LABEL_TEXT = ["|000>", "|001>", "|010>", "|011>", "|100>", "|101>", "|110>", "|111>"]
 
-NUMBER_OF_SHIPS = 8
+
+ASSETS = ImageRegistry(IMAGES)
+# Sprites with a fading alpha share pre-tinted surfaces from here, keyed by
+# the same (name, size) as ASSETS
+TINTS = TintCache(lambda key: ASSETS.get(*key))
+ENEMY_SIZE = (40, 35)
+EXPLOSION_SIZES = [(40, 35), (50, 45)]
+MENU_IMAGES = [('enemy3_1', (40, 40)), ('enemy2_2', (40, 40)),
+               ('enemy1_2', (40, 40)), ('mystery', (80, 40))]
+# Every scaled image the game uses, scaled once while loading
+SCALED_IMAGES = [('enemy{}'.format(img_num), ENEMY_SIZE)
+                 for img_num in ['1_1', '1_2', '2_1', '2_2', '3_1', '3_2']] + \
+                [('explosion{}'.format(color), size)
+                 for color in ['blue', 'green', 'purple'] for size in EXPLOSION_SIZES] + \
+                [('mystery', (75, 35)), ('ship', (23, 23))] + MENU_IMAGES
+NUMBER_OF_QUBITS = SHIP_QUBITS
+NUMBER_OF_SHIPS = 2 ** NUMBER_OF_QUBITS
+# Ships share the 800 pixel wide playfield equally
+SHIP_SPACING = 800 / NUMBER_OF_SHIPS
+SHIP_WIDTH = int(min(IMAGES['ship'].get_width(), 0.8 * SHIP_SPACING))
+SHIP_HEIGHT = IMAGES['ship'].get_height() * SHIP_WIDTH // IMAGES['ship'].get_width()
+POSITIONS = (np.arange(NUMBER_OF_SHIPS) * SHIP_SPACING + 0.2 * SHIP_SPACING).astype(int)
+OFFSETS = ((np.arange(NUMBER_OF_SHIPS) - NUMBER_OF_SHIPS // 2) * SHIP_SPACING).astype(int)
+LABEL_TEXT = ['|{}>'.format(format(i, '0{}b'.format(NUMBER_OF_QUBITS)))
+              for i in range(NUMBER_OF_SHIPS)]
+
+# Ship opacity is quantized: probabilities above each threshold get the next level
+OPACITY_THRESHOLDS = [0.1, 0.25, 0.5, 0.75]
+OPACITY_LEVELS = [0, 0.35, 0.6, 0.8, 1]
+CLASSICAL_LEVEL = len(OPACITY_LEVELS) - 1
+
+
+SHIP_IMAGES = [TINTS.get(('ship', (SHIP_WIDTH, SHIP_HEIGHT)), opacity * 255)
+               for opacity in OPACITY_LEVELS]
 
 BLOCKERS_POSITION = 450
 ENEMY_DEFAULT_POSITION = 65  # Initial value for a new game
@@ -69,21 +133,25 @@ class Ship(sprite.Sprite):
     def __init__(self, id):
         sprite.Sprite.__init__(self)
         self.id = id
-        self.probability = DISTRIBUTIONS[id] / 100.0
-        self.image = IMAGES['ship'].copy()
-        self.image.fill((255, 255, 255, self.probability * 500), None, BLEND_RGBA_MULT)
+        self.ship_group = None
+        self.image = SHIP_IMAGES[CLASSICAL_LEVEL]
         self.speed = 5
         self.rect = self.image.get_rect(topleft=(POSITIONS[self.id], 540))
         self.classical = False
 
+    @property
+    def probability(self):
+        if self.ship_group is None:
+            return 0.0
+        return self.ship_group.probabilities[self.id]
+
     def update(self, *args):
-        self.update_opacity(self.probability)
         game.screen.blit(self.image, self.rect)
 
     def fire(self, measuring, measured_ship):
         if measuring:
             if self is measured_ship:
-                bullet = Bullet(self.rect.x + 23,
+                bullet = Bullet(self.rect.centerx - 2,
                                 self.rect.y + 5, -1,
                                 15, 'laser', 'center', 1.0)
                 game.bullets.add(bullet)
@@ -91,7 +159,7 @@ class Ship(sprite.Sprite):
                 game.sounds['shoot'].play()
 
         else:
-            bullet = Bullet(self.rect.x + 23,
+            bullet = Bullet(self.rect.centerx - 2,
                             self.rect.y + 5, -1,
                             15, 'laser', 'center', self.probability)
             game.bullets.add(bullet)
@@ -99,22 +167,19 @@ class Ship(sprite.Sprite):
             game.sounds['shoot'].play()
 
     def update_opacity(self, prob):
-        self.image = IMAGES['ship'].copy()
-        opacity = 0
         if self.classical:
-            opacity = 1
+            level = CLASSICAL_LEVEL
         else:
-            if prob > 0.75:
-                opacity = 1
-            elif prob > 0.5:
-                opacity = 0.8
-            elif prob > 0.25:
-                opacity = 0.6
-            elif prob > 0.1:
-                opacity = 0.35
-        self.image.fill((255, 255, 255, opacity * 255), None, BLEND_RGBA_MULT)
+            level = int(np.digitize(prob, OPACITY_THRESHOLDS, right=True))
+        self.image = SHIP_IMAGES[level]
 
 class ShipGroup(sprite.Group):
+    """The ship register, one Ship per basis state.
+
+    Positions and opacity levels live in NumPy arrays and are recomputed in
+    one step; the per-ship rects and images are only touched when the
+    layout or the probabilities change.
+    """
     def __init__(self, number_of_ships, position):
         sprite.Group.__init__(self)
         self.ships = [None] * number_of_ships
@@ -124,34 +189,59 @@ class ShipGroup(sprite.Group):
         self.measuring = False
         self.timer = 0.0
         self.state = ShipState.SUPERPOSITION
+        self.probabilities = np.zeros(number_of_ships)
+        self.levels = np.zeros(number_of_ships, dtype=int)
+        self.sampler = OutcomeSampler(number_of_ships)
+        self.layout = None
+        self.blit_list = []
+
+    def ship_xs(self):
+        return (OFFSETS + POSITIONS[self.position]) % 800
 
     def update(self, keys, *args):
         passed = time.get_ticks() - self.timer
         if self.measuring and passed > 600:
             self.measuring = False
 
-        for ship in self:
-            if self.state == ShipState.SUPERPOSITION:
-                ship.classical = False
-                ship.rect.x = (OFFSETS[ship.id] + POSITIONS[self.position]) % 800
-            elif self.state == ShipState.MEASURED:
-                if ship == self.measured_ship:
-                    ship.classical = True
-                    ship.rect.x = (OFFSETS[ship.id] + POSITIONS[self.position]) % 800
-                else:
-                    ship.rect.x = 999999999
-            ship.update_opacity(ship.probability)
-            ship.update()
+        measured_id = self.measured_ship.id if self.measured_ship is not None else None
+        layout = (self.position, self.state, measured_id)
+        if layout != self.layout:
+            self.layout = layout
+            self.relayout()
+        game.screen.blits(self.blit_list, False)
+
+    def relayout(self):
+        """Move and re-tint every ship, then rebuild the blit list"""
+        xs = self.ship_xs()
+        levels = self.levels
+        if self.state == ShipState.MEASURED:
+            # Only the measured ship remains, the others are moved out of reach
+            hidden = np.ones(self.number_of_ships, dtype=bool)
+            if self.measured_ship is not None:
+                hidden[self.measured_ship.id] = False
+                self.measured_ship.classical = True
+            xs = np.where(hidden, 999999999, xs)
+            levels = np.full_like(levels, CLASSICAL_LEVEL)
+        self.blit_list = []
+        for ship, x, level in zip(self.ships, xs.tolist(), levels.tolist()):
+            if ship is not None:
+                ship.rect.x = x
+                ship.image = SHIP_IMAGES[level]
+                if x < 800:
+                    self.blit_list.append((ship.image, ship.rect))
 
     def add_internal(self, *sprites):
         super(ShipGroup, self).add_internal(*sprites)
         for s in sprites:
             self.ships[s.id] = s
+            s.ship_group = self
+        self.layout = None
 
     def remove_internal(self, *sprites):
         super(ShipGroup, self).remove_internal(*sprites)
         for s in sprites:
             self.kill(s)
+        self.layout = None
 
     def fire(self):
         for ship in self:
@@ -164,6 +254,7 @@ class ShipGroup(sprite.Group):
         for ship in self.ships:
             if ship is not None:
                 if ship.id == measured_ship_id:
+                    ship.classical = True
                     ship.update_opacity(1.0)
                     ship.update()
                     self.measured_ship = ship
@@ -173,10 +264,14 @@ class ShipGroup(sprite.Group):
                 # ShipExplosion(ship, sprite.Group())
 
     def update_probabilities(self, probabilities):
-        for ship in self:
-            p_amp = probabilities[ship.id]
-            ship.probability = p_amp.real*p_amp.real + p_amp.imag*p_amp.imag
-            ship.update_opacity(ship.probability)
+        self.probabilities = np.asarray(probabilities, dtype=float)
+        self.levels = np.digitize(self.probabilities, OPACITY_THRESHOLDS, right=True)
+        self.layout = None
+        self.sampler.set_probabilities(self.probabilities)
+
+    def sample_outcome(self):
+        """Measure the ship register using the already known probabilities"""
+        return self.sampler.sample()
 
     def measure(self, measured_ship_id):
         for ship in self.ships:
@@ -206,13 +301,12 @@ class Bullet(sprite.Sprite):
         self.filename = filename
         self.multiplier = multiplier
         self.damage = BULLET_MAX_DAMAGE * multiplier + 1  # accounting for floating point issue
-
-    def update(self, keys, *args):
-        self.image = IMAGES[self.filename].copy()
         alpha = 0
         if self.multiplier > 0.01: # if alpha is above 0 basically
             alpha = max(self.multiplier * 255, 128)
-        self.image.fill((255, 255, 255, alpha), None, BLEND_RGBA_MULT)
+        self.image = TINTS.get((filename, None), alpha)
+
+    def update(self, keys, *args):
         game.screen.blit(self.image, self.rect)
         self.rect.y += self.speed * self.direction
         if self.rect.y < 15 or self.rect.y > 650:
@@ -224,7 +318,6 @@ class Enemy(sprite.Sprite):
         sprite.Sprite.__init__(self)
         self.row = row
         self.column = column
-        self.images = []
         self.load_images()
         self.index = 0
         self.image = self.images[self.index]
@@ -236,9 +329,8 @@ class Enemy(sprite.Sprite):
         self.image = self.images[self.index]
 
     def update(self, *args):
-        self.image = self.images[self.index].copy()
         alpha = max(255 * self.health / ENEMY_HEALTH, 50)
-        self.image.fill((255, 255, 255, alpha), None, BLEND_RGBA_MULT)
+        self.image = TINTS.get(self.image_keys[self.index], alpha)
         game.screen.blit(self.image, self.rect)
 
     def load_images(self):
@@ -248,10 +340,9 @@ class Enemy(sprite.Sprite):
                   3: ['3_1', '3_2'],
                   4: ['3_1', '3_2'],
                   }
-        img1, img2 = (IMAGES['enemy{}'.format(img_num)] for img_num in
-                      images[self.row])
-        self.images.append(transform.scale(img1, (40, 35)))
-        self.images.append(transform.scale(img2, (40, 35)))
+        self.image_keys = [('enemy{}'.format(img_num), ENEMY_SIZE) for img_num in
+                           images[self.row]]
+        self.images = [TINTS.get(key, 255) for key in self.image_keys]
 
 
 class EnemiesGroup(sprite.Group):
@@ -346,27 +437,51 @@ class EnemiesGroup(sprite.Group):
                 is_column_dead = self.is_column_dead(self._leftAliveColumn)
 
 
-class Blocker(sprite.Sprite):
-    def __init__(self, size, color, row, column):
+class Bunker(sprite.Sprite):
+    """A bunker drawn as one surface, with a grid of the blocks still standing"""
+    def __init__(self, size, color, rows, columns):
         sprite.Sprite.__init__(self)
-        self.height = size
-        self.width = size
-        self.color = color
-        self.image = Surface((self.width, self.height))
-        self.image.fill(self.color)
+        self.size = size
+        self.blocks = np.ones((rows, columns), dtype=bool)
+        self.image = Surface((columns * size, rows * size), SRCALPHA)
+        self.image.fill(color)
         self.rect = self.image.get_rect()
-        self.row = row
-        self.column = column
 
-    def update(self, keys, *args):
-        game.screen.blit(self.image, self.rect)
+    def hit(self, rect):
+        """Knock out the blocks under rect and return the area cleared, or None if none were left"""
+        rows, columns = self.blocks.shape
+        top = max((rect.top - self.rect.top) // self.size, 0)
+        bottom = min((rect.bottom - 1 - self.rect.top) // self.size + 1, rows)
+        left = max((rect.left - self.rect.left) // self.size, 0)
+        right = min((rect.right - 1 - self.rect.left) // self.size + 1, columns)
+        if top >= bottom or left >= right or not self.blocks[top:bottom, left:right].any():
+            return None
+        self.blocks[top:bottom, left:right] = False
+        hole = Rect(left * self.size, top * self.size,
+                    (right - left) * self.size, (bottom - top) * self.size)
+        self.image.fill((0, 0, 0, 0), hole)
+        return hole.move(self.rect.topleft)
+
+
+class BunkerGroup(LayerGroup):
+    """Bunkers on the static layer, hit by indexing their block grids"""
+    def collide(self, sprites, dokill=True):
+        for spr in sprites.sprites():
+            hit = False
+            for bunker in self:
+                if bunker.rect.colliderect(spr.rect):
+                    hole = bunker.hit(spr.rect)
+                    if hole:
+                        self.layer.invalidate(hole)
+                        hit = True
+            if hit and dokill:
+                spr.kill()
 
 
 class Mystery(sprite.Sprite):
     def __init__(self):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES['mystery']
-        self.image = transform.scale(self.image, (75, 35))
+        self.image = ASSETS.get('mystery', (75, 35))
         self.rect = self.image.get_rect(topleft=(-80, 45))
         self.row = 5
         self.moveTime = 25000
@@ -407,15 +522,15 @@ class Mystery(sprite.Sprite):
 class EnemyExplosion(sprite.Sprite):
     def __init__(self, enemy, *groups):
         super(EnemyExplosion, self).__init__(*groups)
-        self.image = transform.scale(self.get_image(enemy.row), (40, 35))
-        self.image2 = transform.scale(self.get_image(enemy.row), (50, 45))
+        self.image = ASSETS.get(self.get_image_name(enemy.row), EXPLOSION_SIZES[0])
+        self.image2 = ASSETS.get(self.get_image_name(enemy.row), EXPLOSION_SIZES[1])
         self.rect = self.image.get_rect(topleft=(enemy.rect.x, enemy.rect.y))
         self.timer = time.get_ticks()
 
     @staticmethod
-    def get_image(row):
+    def get_image_name(row):
         img_colors = ['purple', 'blue', 'blue', 'green', 'green']
-        return IMAGES['explosion{}'.format(img_colors[row])]
+        return 'explosion{}'.format(img_colors[row])
 
     def update(self, current_time, *args):
         passed = current_time - self.timer
@@ -460,38 +575,45 @@ class ShipExplosion(sprite.Sprite):
 class Life(sprite.Sprite):
     def __init__(self, xpos, ypos):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES['ship']
-        self.image = transform.scale(self.image, (23, 23))
+        self.image = ASSETS.get('ship', (23, 23))
         self.rect = self.image.get_rect(topleft=(xpos, ypos))
 
-    def update(self, *args):
-        game.screen.blit(self.image, self.rect)
-
 
 class Text(object):
     def __init__(self, textFont, size, message, color, xpos, ypos):
-        self.font = font.Font(textFont, size)
-        self.surface = self.font.render(message, True, color)
+        self.font = FONTS.get(textFont, size)
+        self.surface = TEXTS.render(textFont, size, message, color)
         self.rect = self.surface.get_rect(topleft=(xpos, ypos))
 
     def draw(self, surface):
         surface.blit(self.surface, self.rect)
 
 
+class AtlasText(Text):
+    """Text composed from a glyph atlas instead of rendered with the font"""
+    def __init__(self, atlas, message, xpos, ypos):
+        self.surface = atlas.render(message)
+        self.rect = self.surface.get_rect(topleft=(xpos, ypos))
+
+
 class Labels(object):
+    """Ket labels under the ships, drawn with a single blits call"""
     def __init__(self):
         self.labels = []
+        self.stride = 1
+        self.glyphs = GlyphAtlas(FONTS.get(FONT, 20), '|01>', WHITE)
 
     def initialize(self, position):
-        self.labels = []
-        for i in range(8):
-            self.labels.append(Text(FONT, 20, LABEL_TEXT[i], WHITE, POSITIONS[position] + OFFSETS[i], 600))
+        self.labels = [AtlasText(self.glyphs, LABEL_TEXT[i], 0, 600)
+                       for i in range(NUMBER_OF_SHIPS)]
+        # With many ships only every stride-th label fits on screen
+        label_width = max(label.rect.width for label in self.labels)
+        self.stride = max(1, int(np.ceil(label_width / SHIP_SPACING)))
 
     def update(self, screen, position):
-        for i in range(len(self.labels)):
-            self.labels[i].rect = self.labels[i].surface.get_rect(topleft=((POSITIONS[position] + OFFSETS[i]) % 800, 600))
-        for label in self.labels:
-            label.draw(screen)
+        xs = ((POSITIONS[position] + OFFSETS) % 800).tolist()
+        screen.blits([(self.labels[i].surface, (xs[i], 600))
+                      for i in range(0, len(self.labels), self.stride)], False)
 """
 class PauseBar(sprite.Sprite):
     def __init__(self, mystery, score, *groups):
@@ -524,7 +646,9 @@ class SpaceInvaders(object):
         init()
         self.clock = time.Clock()
         self.caption = display.set_caption('Space Invaders')
-        self.screen = SCREEN
+        self.screen = DirtyScreen(SCREEN, DIRTY_RECT_RENDERING)
+        if DIRTY_RECT_RENDERING:
+            atexit.register(lambda: print(self.screen.report()))
         self.background = image.load(IMAGE_PATH + 'qiskit.png').convert()
         self.startGame = False
         self.mainScreen = True
@@ -544,17 +668,40 @@ class SpaceInvaders(object):
         self.enemy3Text = Text(FONT, 25, '   =  30 pts', PURPLE, 368, 370)
         self.enemy4Text = Text(FONT, 25, '   =  ?????', RED, 368, 420)
         self.scoreText = Text(FONT, 20, 'Score', WHITE, 5, 5)
+        self.scoreGlyphs = GlyphAtlas(FONTS.get(FONT, 20), DIGITS, GREEN)
         self.livesText = Text(FONT, 20, 'Lives ', WHITE, 640, 5)
 
         self.life1 = Life(715, 3)
         self.life2 = Life(742, 3)
         self.life3 = Life(769, 3)
-        self.livesGroup = sprite.Group(self.life1, self.life2, self.life3)
-
-        self.shipPosition = 4
-
-        self.circuit_grid_model = CircuitGridModel(3, 10)
-        self.circuit_grid = CircuitGrid(0, SCREEN_HEIGHT , self.circuit_grid_model)
+        # The background, HUD labels, lives and blockers are composited once
+        # and only redrawn where a life or blocker goes away
+        self.staticLayer = StaticLayer(self.background)
+        self.livesGroup = LayerGroup(self.staticLayer, self.life1, self.life2, self.life3)
+        self.bunkers = BunkerGroup(self.staticLayer)
+        self.staticLayer.add(self.scoreText, self.livesText, self.livesGroup, self.bunkers)
+
+        self.shipPosition = NUMBER_OF_SHIPS // 2
+
+        self.circuit_grid_model = CircuitGridModel(NUMBER_OF_QUBITS, 10)
+        # Taller registers push the composer up so it stays above the ships
+        grid_top = min(SCREEN_HEIGHT, 520 - GRID_HEIGHT * (NUMBER_OF_QUBITS + 1))
+        self.circuit_grid = CircuitGrid(0, grid_top, self.circuit_grid_model)
+        ASSETS.warm(SCALED_IMAGES)
+        startup_timer.mark('assets')
+        self.backend = get_backend(self.circuit_grid_model.max_wires,
+                                   self.circuit_grid_model.max_columns)
+        # Only the worker touches the backend once it has started
+        self.ship_probabilities = self.get_probabilities(self.circuit_grid_model)
+        self.submitted_version = self.circuit_grid_model.version
+        # Worker request whose result describes the submitted grid
+        self.simulation_request = None
+        # Grid version the current ship probabilities were simulated for
+        self.probabilities_version = self.circuit_grid_model.version
+        self.history = CircuitHistory(UNDO_HISTORY_BYTES)
+        self.start_simulation_worker()
+        startup_timer.mark('simulator')
+        self.startup_timer = startup_timer
         self.paused = False
         #self.pause_bar = 0
         #self.pause_ready = False
@@ -574,27 +721,22 @@ class SpaceInvaders(object):
         self.mysteryGroup = sprite.Group(self.mysteryShip)
         self.enemyBullets = sprite.Group()
         self.make_enemies()
-        self.allSprites = sprite.Group(self.player, self.enemies,
-                                       self.livesGroup, self.mysteryShip)
+        self.allSprites = sprite.Group(self.enemies, self.mysteryShip)
         self.keys = key.get_pressed()
 
         self.timer = time.get_ticks()
         self.noteTimer = time.get_ticks()
         self.shipTimer = time.get_ticks()
         self.score = score
+        self.scoreTextValue = None
         self.create_audio()
         self.makeNewShip = False
         self.shipAlive = True
 
-    def make_blockers(self, number):
-        blockerGroup = sprite.Group()
-        for row in range(4):
-            for column in range(9):
-                blocker = Blocker(10, GREEN, row, column)
-                blocker.rect.x = 50 + (200 * number) + (column * blocker.width)
-                blocker.rect.y = BLOCKERS_POSITION + (row * blocker.height)
-                blockerGroup.add(blocker)
-        return blockerGroup
+    def make_bunker(self, number):
+        bunker = Bunker(10, GREEN, 4, 9)
+        bunker.rect.topleft = (50 + (200 * number), BLOCKERS_POSITION)
+        return bunker
 
     def create_audio(self):
         mixer.init(48000, -16, 1, 1024)
@@ -631,23 +773,8 @@ class SpaceInvaders(object):
         # type: (pygame.event.EventType) -> bool
         return evt.type == QUIT or (evt.type == KEYUP and evt.key == K_ESCAPE)
 
-    def get_probability_amplitudes(self, circuit, qubit_num, shot_num):
-        backend_sv_sim = BasicAer.get_backend('statevector_simulator')
-        job_sim = execute(circuit, backend_sv_sim, shots=shot_num)
-        result_sim = job_sim.result()
-        quantum_state = result_sim.get_statevector(circuit, decimals=3)
-        return quantum_state
-    
-    def get_measurement(self, circuit, qubit_num, shot_num):
-        backend_sv_sim = BasicAer.get_backend('qasm_simulator')
-        cr = ClassicalRegister(qubit_num)
-        measure_circuit = deepcopy(circuit)  # make a copy of circuit
-        measure_circuit.add_register(cr)    # add classical registers for measurement readout
-        measure_circuit.measure(measure_circuit.qregs[0], measure_circuit.cregs[0])
-        job_sim = execute(measure_circuit, backend_sv_sim, shots=shot_num)
-        result_sim = job_sim.result()
-        counts = result_sim.get_counts(circuit)
-        return int(list(counts.keys())[0], 2)
+    def get_probabilities(self, circuit_grid_model):
+        return self.backend.get_probabilities(circuit_grid_model)
 
     def check_input(self):
         self.keys = key.get_pressed()
@@ -691,14 +818,17 @@ class SpaceInvaders(object):
                     elif e.key == K_o:
                         self.player.state = ShipState.SUPERPOSITION
                         if self.player.position >= 0:
-                            self.player.position = (self.player.position - 1) % 8
+                            self.player.position = (self.player.position - 1) % NUMBER_OF_SHIPS
                             self.player.update(self.keys)
                     elif e.key == K_p:
                         self.player.state = ShipState.SUPERPOSITION
-                        if self.player.position <= 7:
-                            self.player.position = (self.player.position + 1) % 8
+                        if self.player.position < NUMBER_OF_SHIPS:
+                            self.player.position = (self.player.position + 1) % NUMBER_OF_SHIPS
                             self.player.update(self.keys)
                 else:
+                    before_version = self.circuit_grid_model.version
+                    before = self.circuit_grid_model.fingerprint()
+                    before_probabilities = self.current_probabilities()
                     if e.key == K_a:
                         self.circuit_grid.move_to_adjacent_node(MOVE_LEFT)
                     elif e.key == K_d:
@@ -732,12 +862,37 @@ class SpaceInvaders(object):
                     elif e.key == K_RIGHT:
                         # Rotate a gate
                         self.circuit_grid.handle_input_rotate(np.pi / 8)
-                    circuit = self.circuit_grid.circuit_grid_model.compute_circuit()
-                    state = self.get_probability_amplitudes(circuit, 3, 100)
-                    self.player.update_probabilities(state)
-                    self.circuit_grid.draw(self.screen)
-                    self.player.update(self.keys)
-                    display.flip()
+                    elif e.key == K_u:
+                        self.apply_grid_change(self.history.undo(before_probabilities))
+                    elif e.key == K_r:
+                        self.apply_grid_change(self.history.redo(before_probabilities))
+                    if e.key not in (K_u, K_r) and self.circuit_grid_model.version != before_version:
+                        self.history.record(before, self.circuit_grid_model.fingerprint(),
+                                            before_probabilities)
+                    if self.circuit_grid_model.version != self.submitted_version:
+                        self.submitted_version = self.circuit_grid_model.version
+                        self.simulation_request = self.simulation_worker.submit(self.circuit_grid_model)
+
+    def current_probabilities(self):
+        """Ship probabilities if they were simulated for the grid as it is now, else None"""
+        if self.probabilities_version == self.circuit_grid_model.version:
+            return self.ship_probabilities
+        return None
+
+    def apply_grid_change(self, change):
+        """Undo or redo an edit, reusing the probabilities stored with it when it has them"""
+        if change is None:
+            return
+        for wire_num, column_num, node in change.nodes:
+            self.circuit_grid_model.set_node(wire_num, column_num, node)
+        self.circuit_grid.update()
+        if change.probabilities is not None:
+            self.simulation_worker.cancel()
+            self.simulation_request = None
+            self.submitted_version = self.circuit_grid_model.version
+            self.probabilities_version = self.circuit_grid_model.version
+            self.ship_probabilities = change.probabilities
+            self.player.update_probabilities(self.ship_probabilities)
 
     def make_enemies(self):
         enemies = EnemiesGroup(10, 5)
@@ -757,9 +912,37 @@ class SpaceInvaders(object):
             ships.add(ship)
         ships.update([])
         self.player = ships
-        circuit = self.circuit_grid.circuit_grid_model.compute_circuit()
-        state = self.get_probability_amplitudes(circuit, 3, 100)
-        self.player.update_probabilities(state)
+        self.player.update_probabilities(self.ship_probabilities)
+
+    def start_simulation_worker(self):
+        self.simulation_worker = SimulationWorker(self.backend,
+                                                  self.circuit_grid_model.max_wires,
+                                                  self.circuit_grid_model.max_columns)
+        self.simulation_worker.start()
+
+    def collect_simulation_result(self):
+        if not self.simulation_worker.is_alive():
+            # A dead worker would drop every later edit, so start a new one
+            print("Simulation worker stopped, restarting it")
+            self.start_simulation_worker()
+            if self.probabilities_version != self.circuit_grid_model.version:
+                self.submitted_version = self.circuit_grid_model.version
+                self.simulation_request = self.simulation_worker.submit(self.circuit_grid_model)
+            return
+        result = self.simulation_worker.poll()
+        if result is None:
+            return
+        request, probabilities, error = result
+        # Results of requests other than the last one describe an older grid
+        if request != self.simulation_request:
+            return
+        if error is not None:
+            # Keep the last probabilities until an edit can be simulated
+            print("Could not simulate the circuit: ", error)
+            return
+        self.ship_probabilities = probabilities
+        self.probabilities_version = self.submitted_version
+        self.player.update_probabilities(self.ship_probabilities)
 
     def make_enemies_shoot(self):
         if (time.get_ticks() - self.timer) > 700 and self.enemies:
@@ -770,6 +953,12 @@ class SpaceInvaders(object):
             self.allSprites.add(self.enemyBullets)
             self.timer = time.get_ticks()
 
+    def update_score_text(self):
+        """Re-render the score only when it has changed"""
+        if self.score != self.scoreTextValue:
+            self.scoreText2 = AtlasText(self.scoreGlyphs, str(self.score), 85, 5)
+            self.scoreTextValue = self.score
+
     def calculate_score(self, row):
         scores = {0: 30,
                   1: 20,
@@ -784,14 +973,8 @@ class SpaceInvaders(object):
         return score
 
     def create_main_menu(self):
-        self.enemy1 = IMAGES['enemy3_1']
-        self.enemy1 = transform.scale(self.enemy1, (40, 40))
-        self.enemy2 = IMAGES['enemy2_2']
-        self.enemy2 = transform.scale(self.enemy2, (40, 40))
-        self.enemy3 = IMAGES['enemy1_2']
-        self.enemy3 = transform.scale(self.enemy3, (40, 40))
-        self.enemy4 = IMAGES['mystery']
-        self.enemy4 = transform.scale(self.enemy4, (80, 40))
+        self.enemy1, self.enemy2, self.enemy3, self.enemy4 = \
+            (ASSETS.get(name, size) for name, size in MENU_IMAGES)
         self.screen.blit(self.enemy1, (318, 270))
         self.screen.blit(self.enemy2, (318, 320))
         self.screen.blit(self.enemy3, (318, 370))
@@ -822,14 +1005,13 @@ class SpaceInvaders(object):
 
         collision_handled = False
 
-        circuit = self.circuit_grid.circuit_grid_model.compute_circuit()
-        state = self.get_measurement(circuit, 3, 1)
-
         hits = sprite.groupcollide(self.playerGroup, self.enemyBullets,
                                           False, True)
         self.player.measuring = False
 
-        if self.player.state == ShipState.SUPERPOSITION:
+        if hits and self.player.state == ShipState.SUPERPOSITION:
+            # Only measure the ships when a bullet actually hit one of them
+            state = self.player.sample_outcome()
             for ship in hits:
                 if ship.probability > 0.0:
                     self.player.measure(state)
@@ -886,10 +1068,10 @@ class SpaceInvaders(object):
                 self.gameOver = True
                 self.startGame = False
 
-        sprite.groupcollide(self.bullets, self.allBlockers, True, True)
-        sprite.groupcollide(self.enemyBullets, self.allBlockers, True, True)
+        self.bunkers.collide(self.bullets)
+        self.bunkers.collide(self.enemyBullets)
         if self.enemies.bottom >= BLOCKERS_POSITION:
-            sprite.groupcollide(self.enemies, self.allBlockers, False, True)
+            self.bunkers.collide(self.enemies, False)
 
     def create_new_ship(self, createShip, currentTime):
 
@@ -897,7 +1079,6 @@ class SpaceInvaders(object):
             self.player = ShipGroup(NUMBER_OF_SHIPS, self.shipPosition)
             self.make_ships()
             self.labels.initialize(self.player.position)
-            self.allSprites.add(self.player)
             self.playerGroup.add(self.player)
             self.makeNewShip = False
             self.shipAlive = True
@@ -938,11 +1119,12 @@ class SpaceInvaders(object):
                     if self.should_exit(e):
                         sys.exit()
                     if e.type == KEYUP:
-                        # Only create blockers on a new game, not a new round
-                        self.allBlockers = sprite.Group(self.make_blockers(0),
-                                                        self.make_blockers(1),
-                                                        self.make_blockers(2),
-                                                        self.make_blockers(3))
+                        # Only create bunkers on a new game, not a new round
+                        self.bunkers.empty()
+                        self.bunkers.add(self.make_bunker(0),
+                                         self.make_bunker(1),
+                                         self.make_bunker(2),
+                                         self.make_bunker(3))
                         self.livesGroup.add(self.life1, self.life2, self.life3)
                         self.reset(0)
                         self.startGame = True
@@ -952,16 +1134,15 @@ class SpaceInvaders(object):
                 if not self.enemies and not self.explosionsGroup and not self.paused:
                     currentTime = time.get_ticks()
                     if currentTime - self.gameTimer < 3000:
-                        self.screen.blit(self.background, (0, 0))
-                        self.scoreText2 = Text(FONT, 20, str(self.score),
-                                               GREEN, 85, 5)
+                        self.screen.draw_background(self.background)
+                        self.update_score_text()
                         self.scoreText.draw(self.screen)
                         self.scoreText2.draw(self.screen)
                         self.nextRoundText.draw(self.screen)
                         self.livesText.draw(self.screen)
                         #self.circuit_grid.draw(self.screen)
                         # self.player.draw(self.screen)
-                        self.livesGroup.update()
+                        self.livesGroup.draw(self.screen)
                         self.check_input()
                         self.labels.update(self.screen, self.player.position)
                     if currentTime - self.gameTimer > 3000:
@@ -971,23 +1152,21 @@ class SpaceInvaders(object):
                         self.gameTimer += 3000
                 else:
 
-                    self.screen.blit(self.background, (0, 0))
-                    self.allBlockers.update(self.screen)
-                    self.scoreText2 = Text(FONT, 20, str(self.score), GREEN,
-                                           85, 5)
-                    self.scoreText.draw(self.screen)
+                    self.staticLayer.draw(self.screen)
+                    self.update_score_text()
                     self.scoreText2.draw(self.screen)
-                    self.livesText.draw(self.screen)
                     #self.circuit_grid.draw(self.screen)
                     self.labels.update(self.screen, self.player.position)
                     # self.player.draw(self.screen)
                     self.check_input()
+                    self.collect_simulation_result()
                     if not self.paused:
                         currentTime = time.get_ticks()
                         self.play_main_music(currentTime)
                         self.enemies.update(currentTime)
                         self.make_enemies_shoot()
                         self.allSprites.update(self.keys, currentTime)
+                        self.player.update(self.keys)
                         self.explosionsGroup.update(currentTime)
                         self.check_collisions()
                         self.create_new_ship(self.makeNewShip, currentTime)
@@ -1005,7 +1184,11 @@ class SpaceInvaders(object):
                 self.enemyPosition = ENEMY_DEFAULT_POSITION
                 self.create_game_over(currentTime)
 
-            display.update()
+            self.screen.present()
+            if self.startup_timer is not None:
+                self.startup_timer.mark('first frame')
+                self.startup_timer.report()
+                self.startup_timer = None
             self.clock.tick(60)
 
 
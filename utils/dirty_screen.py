@@ -0,0 +1,97 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pygame
+
+
+class DirtyScreen(object):
+    """Wraps the display surface and pushes only changed areas to the display.
+
+    Every blit made through it is recorded. On present, blits that repeat one
+    from the previous frame exactly are left out, and the rectangles of the
+    remaining blits, plus those drawn last frame but not in this one, are
+    passed to display.update. Any other surface method is forwarded.
+    """
+    def __init__(self, surface, enabled=True):
+        self.surface = surface
+        self.enabled = enabled
+        self.full = True
+        self.background = None
+        self.drawn = {}
+        self.previous = {}
+        # Holding on to the sources keeps their ids from being reused by a
+        # new surface while they are still compared against
+        self.sources = []
+        self.previous_sources = []
+        self.pixels = 0
+        self.frames = 0
+        self.total_pixels = 0
+
+    def __getattr__(self, name):
+        return getattr(self.surface, name)
+
+    def record(self, source, rect, area=None, special_flags=0):
+        if self.enabled and rect.width and rect.height:
+            key = (id(source), tuple(rect), None if area is None else tuple(area), special_flags, 0)
+            # Blending the same translucent blit twice changes the result, so
+            # repeats within a frame are told apart by their count
+            while key in self.drawn:
+                key = key[:-1] + (key[-1] + 1,)
+            self.drawn[key] = rect
+            self.sources.append(source)
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        rect = self.surface.blit(source, dest, area, special_flags)
+        self.record(source, rect, area, special_flags)
+        return rect
+
+    def blits(self, blit_sequence, doreturn=1):
+        blit_sequence = list(blit_sequence)
+        rects = self.surface.blits(blit_sequence, True)
+        for item, rect in zip(blit_sequence, rects):
+            self.record(item[0], rect, *item[2:])
+        return rects if doreturn else None
+
+    def draw_background(self, background):
+        """Cover last frame's drawing with the background, or all of it after a full refresh"""
+        if not self.enabled or self.full or background is not self.background:
+            self.background = background
+            self.blit(background, (0, 0))
+        else:
+            for rect in self.previous.values():
+                self.surface.blit(background, rect, rect)
+
+    def invalidate(self):
+        """Push the whole screen on the next present"""
+        self.full = True
+
+    def present(self):
+        if self.enabled and not self.full:
+            rects = [rect for key, rect in self.drawn.items() if key not in self.previous]
+            rects += [rect for key, rect in self.previous.items() if key not in self.drawn]
+            pygame.display.update(rects)
+            self.pixels = sum(rect.width * rect.height for rect in rects)
+        else:
+            pygame.display.update()
+            self.pixels = self.surface.get_width() * self.surface.get_height()
+        self.full = False
+        self.previous, self.drawn = self.drawn, {}
+        self.previous_sources, self.sources = self.sources, []
+        self.frames += 1
+        self.total_pixels += self.pixels
+
+    def report(self):
+        return 'Pushed {} pixels per frame on average over {} frames'.format(
+            self.total_pixels // max(self.frames, 1), self.frames)
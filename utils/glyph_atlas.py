@@ -0,0 +1,56 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pygame
+
+DIGITS = '0123456789'
+
+
+class GlyphAtlas:
+    """Glyphs of one font and color, rasterized once into a single surface.
+
+    Text made only of the atlas' characters is composed by blitting glyph
+    subsurfaces, so it needs no font rendering at all.
+    """
+    def __init__(self, font, characters, color):
+        rendered = [font.render(character, True, color) for character in characters]
+        self.height = max(glyph.get_height() for glyph in rendered)
+        self.surface = pygame.Surface((sum(glyph.get_width() for glyph in rendered), self.height),
+                                      pygame.SRCALPHA)
+        self.glyphs = {}
+        xpos = 0
+        for character, glyph in zip(characters, rendered):
+            self.surface.blit(glyph, (xpos, 0))
+            self.glyphs[character] = self.surface.subsurface((xpos, 0, glyph.get_width(), self.height))
+            xpos += glyph.get_width()
+
+    def size(self, message):
+        return sum(self.glyphs[character].get_width() for character in message), self.height
+
+    def draw(self, target, message, position):
+        """Blit message onto target with its top left corner at position"""
+        xpos, ypos = position
+        blits = []
+        for character in message:
+            glyph = self.glyphs[character]
+            blits.append((glyph, (xpos, ypos)))
+            xpos += glyph.get_width()
+        target.blits(blits, False)
+
+    def render(self, message):
+        """New surface holding message"""
+        surface = pygame.Surface(self.size(message), pygame.SRCALPHA)
+        self.draw(surface, message, (0, 0))
+        return surface
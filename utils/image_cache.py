@@ -0,0 +1,72 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pygame
+
+
+class ImageRegistry:
+    """Loaded images by name, plus scaled copies memoized by (name, size).
+
+    Surfaces are shared by reference between every sprite that asks for
+    the same (name, size), so callers must not draw on them.
+    """
+    def __init__(self, images):
+        self.images = images
+        self.scaled = {}
+
+    def get(self, name, size=None):
+        if size is None:
+            return self.images[name]
+        key = (name, tuple(size))
+        surface = self.scaled.get(key)
+        if surface is None:
+            surface = pygame.transform.scale(self.images[name], key[1]).convert_alpha()
+            self.scaled[key] = surface
+        return surface
+
+    def warm(self, keys):
+        """Scale every (name, size) up front, e.g. while the game loads"""
+        for name, size in keys:
+            self.get(name, size)
+
+
+class TintCache:
+    """Alpha-tinted copies of images, rendered once per quantized alpha level.
+
+    Images are identified by any hashable key that load() turns into the
+    source surface. get() returns the cached surface itself, so callers
+    must not draw on it.
+    """
+    def __init__(self, load, levels=32):
+        self.load = load
+        self.levels = levels
+        self.surfaces = {}
+
+    def level(self, alpha):
+        """Nearest of the quantized levels to an alpha between 0 and 255"""
+        return int(round(min(max(alpha, 0), 255) * (self.levels - 1) / 255.0))
+
+    def get(self, key, alpha):
+        level = self.level(alpha)
+        surface = self.surfaces.get((key, level))
+        if surface is None:
+            surface = self.load(key).copy()
+            surface.fill((255, 255, 255, round(level * 255.0 / (self.levels - 1))),
+                         None, pygame.BLEND_RGBA_MULT)
+            self.surfaces[(key, level)] = surface
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
@@ -0,0 +1,76 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pygame
+
+# Past this many damaged rectangles a layer redraws their union in one pass
+MAX_DAMAGED_RECTS = 16
+
+
+class StaticLayer(object):
+    """A background with the parts that rarely change composited onto it.
+
+    Parts are anything with a draw(surface) method, such as Text or a sprite
+    group. They are drawn once; afterwards only invalidated rectangles are
+    redrawn, from the background and the parts clipped to each rectangle.
+    """
+    def __init__(self, background, *parts):
+        self.background = background
+        self.surface = background.copy()
+        self.parts = list(parts)
+        self.damaged = [self.surface.get_rect()]
+
+    def add(self, *parts):
+        self.parts.extend(parts)
+        self.invalidate()
+
+    def invalidate(self, rect=None):
+        self.damaged.append(self.surface.get_rect() if rect is None else pygame.Rect(rect))
+
+    def update(self):
+        """Redraw the damaged regions of the layer and return them"""
+        damaged, self.damaged = self.damaged, []
+        if len(damaged) > MAX_DAMAGED_RECTS:
+            damaged = [damaged[0].unionall(damaged[1:])]
+        for rect in damaged:
+            self.surface.set_clip(rect)
+            self.surface.blit(self.background, rect, rect)
+            for part in self.parts:
+                part.draw(self.surface)
+        self.surface.set_clip(None)
+        return damaged
+
+    def draw(self, screen):
+        """Put the layer under this frame's sprites on a DirtyScreen"""
+        damaged = self.update()
+        screen.draw_background(self.surface)
+        # Regions that changed on the layer have to be pushed as well
+        for rect in damaged:
+            screen.blit(self.surface, rect, rect)
+
+
+class LayerGroup(pygame.sprite.Group):
+    """Sprite group drawn on a StaticLayer, invalidating it as sprites come and go"""
+    def __init__(self, layer, *sprites):
+        self.layer = layer
+        super(LayerGroup, self).__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super(LayerGroup, self).add_internal(sprite, layer)
+        self.layer.invalidate(sprite.rect)
+
+    def remove_internal(self, sprite):
+        super(LayerGroup, self).remove_internal(sprite)
+        self.layer.invalidate(sprite.rect)
@@ -21,6 +21,24 @@ CIRCUIT_DEPTH = 18
 
 WIN_SCORE = 7
 
+# Simulator backend: "qiskit", "numpy", "stabilizer" or "auto" to benchmark
+# the candidates in simulator_backends.AUTO_CANDIDATES at startup and route
+# each circuit to the fastest one that supports it. "stabilizer" hands grids
+# with non-Clifford gates to "numpy". Can be overridden with
+# SPACE_INVADERS_BACKEND.
+# Qiskit is only imported when it is selected here or a circuit is exported.
+SIMULATOR_BACKEND = 'auto'
+# Number of circuit statevectors remembered by the simulator cache
+STATEVECTOR_CACHE_SIZE = 256
+# Shots per Qiskit measurement job, handed out one measurement at a time
+MEASUREMENT_SHOTS = 256
+# Memory budget in bytes for the composer's undo/redo history
+UNDO_HISTORY_BYTES = 64 * 1024
+# Number of qubits in the ship register (2 to 6), giving 2^n ships
+SHIP_QUBITS = 3
+# Push only the changed parts of the window to the display each frame
+DIRTY_RECT_RENDERING = True
+
 # For ball.py
 LEFT = 0
 RIGHT = 1
@@ -0,0 +1,63 @@
+#
+# Copyright 2019 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import OrderedDict
+
+import pygame
+
+
+class FontRegistry:
+    """pygame Font objects, opened once per (path, size)"""
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, path, size):
+        font = self.fonts.get((path, size))
+        if font is None:
+            font = pygame.font.Font(path, size)
+            self.fonts[(path, size)] = font
+        return font
+
+
+class TextCache:
+    """Bounded LRU cache of rendered text surfaces.
+
+    Keyed by (font path, size, message, color). Returned surfaces are
+    shared, so callers must not draw on them.
+    """
+    def __init__(self, fonts, maxsize=256):
+        self.fonts = fonts
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, path, size, message, color):
+        key = (path, size, message, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.fonts.get(path, size).render(message, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()